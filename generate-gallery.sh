@@ -3,6 +3,7 @@ set -euo pipefail
 
 SCRIPT="./tries.py"
 OUTDIR="EXAMPLES"
+SPEC="${OUTDIR}/gallery.json"
 
 mkdir -p "$OUTDIR"
 
@@ -15,15 +16,23 @@ echo
 echo "- Listing themes..."
 mapfile -t THEMES < <("$SCRIPT" --list-themes)
 
-for theme in "${THEMES[@]}"; do
-    outfile="${OUTDIR}/theme-${theme}.pdf"
-
-    echo "  - Rendering theme: ${theme}"
-    echo "    Command: $SCRIPT --sample-hosts -H -T ${theme} | dot -Tpdf -o ${outfile}"
-
-    "$SCRIPT" --sample-hosts -H -T "${theme}" \
-        | dot -Tpdf -o "${outfile}"
-done
+# One batch job per theme: the samples are parsed and the trie is built
+# once, then each theme is painted and rendered in parallel.
+echo "- Writing batch spec: ${SPEC}"
+{
+    echo '{"jobs": ['
+    sep=""
+    for theme in "${THEMES[@]}"; do
+        outfile="${OUTDIR}/theme-${theme}.pdf"
+        echo "  - Queued theme: ${theme} -> ${outfile}" >&2
+        printf '%s  {"theme": "%s", "output": "%s"}' "$sep" "$theme" "$outfile"
+        sep=$',\n'
+    done
+    printf '\n]}\n'
+} > "$SPEC"
+
+echo "    Command: $SCRIPT --sample-hosts -H --batch ${SPEC}"
+"$SCRIPT" --sample-hosts -H --batch "$SPEC"
 
 echo
 echo "- Theme gallery complete."
@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+#    run-tests.py
+#    Feature regression suite for tries.py.
+#    GPLv3 — David Marsh, 2019–2025
+#
+#    Runs every case through tries.main() in-process and compares the DOT
+#    output against the golden files in golden/. Snapshot round trips are
+#    compared against a direct run instead. Rendering PNGs with Graphviz is
+#    optional (--png) and runs on a worker pool.
+#
+#    Usage:
+#      ./run-tests.py               check all cases against golden/
+#      ./run-tests.py --update      rewrite golden/ from the current output
+#      ./run-tests.py --png         also render EXAMPLES/tests/<case>.png
+#      ./run-tests.py hosts_TB ...  only run the named cases
+
+import argparse
+import contextlib
+import difflib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+GOLDEN = HERE / "golden"
+OUTDIR = HERE / "EXAMPLES" / "tests"
+
+# tries.py loads themes.py and samples.py from the working directory, so
+# import it from the repository root exactly as ./tries.py would run.
+os.chdir(HERE)
+sys.path.insert(0, str(HERE))
+import tries  # noqa: E402
+
+# ---------------------------------------------------------------------------
+# Input fixtures (written to a temporary directory, referenced as fixture:NAME)
+# ---------------------------------------------------------------------------
+
+FIXTURES = {
+    "hosts_old": "acmefw01\nacmefw02\nacmesw01\n",
+    "hosts_new": "acmefw01\nacmefw03\nacmesw01\nacmesw01-oob\n",
+    "ips_old": "10.0.0.1\n10.0.1.1\n",
+    "ips_new": "10.0.0.1\n10.0.2.1\n",
+    # Only the same after FQDN/domain stripping and --ignore-case
+    "hosts_fqdn_old": "acmefw01.domain.local\nACME\\acmesw01\nACMEWEB01\nacmefw02\n",
+    "hosts_fqdn_new": "acmefw01\nacmesw01.domain.local\nacmeweb01\nacmefw03\n",
+    "ips_prefix_old": "10.0.0.1\n10.0.2\n10.0.3.1\n",
+    "ips_prefix_new": "10.0.0\n10.0.0.1\n10.0.2\n10.0.2.1\n10.0.3.1\n10.0.3.2\n",
+    "urls_old": "https://Example.com/app\nhttps://example.com/app/a\n",
+    "urls_new": "https://Example.com/app\nhttps://example.com/app/b\n",
+    "events": (
+        "2025-03-01T10:00:00Z acmefw01\n2025-03-01T10:01:00Z acmefw02\n"
+        "2025-03-01T10:02:00Z acmesw01\n2025-03-01T10:05:00Z acmefw01\n"
+        "2025-03-01T10:07:00Z acmefw01-oob\n1740823740 localhost\n"
+    ),
+    # Late lines: ccc expires at 1070 although it arrived after bbb, and
+    # the late bbb must not pull bbb's last-seen time back to 1040
+    "events_late": "1000 aaa\n1050 bbb\n1010 ccc\n1075 ddd\n1040 bbb\n1105 eee\n",
+    "cmdb": "hostname,owner,colour\nACMEFW01.domain.local,netops,tomato\nacmesw01,netops,tomato\nacmeweb01,web,lightblue2\n",
+    "inventory": (
+        "id;hostname;oob\n1;acmefw01.domain.local;yes\n2;\"acmefw02;lab\";no\n"
+        "3;acmesw01.domain.local;\n4;;1\n5;acmeweb01;true\n"
+    ),
+    "flows": (
+        '{"src": {"ip": "10.0.0.1"}, "bytes": 10}\n{"src": {"ip": "10.0.1.20"}}\n\n'
+        '{"dst": {"ip": "8.8.8.8"}}\n{"src": {"ip": "192.168.0.1"}}\n'
+    ),
+}
+
+# --batch specs, referenced as batch:NAME. Job outputs are written to the
+# temporary directory and appended to the case output, in job order.
+BATCH_SPECS = {
+    "hosts_jobs": {
+        "defaults": {"head": True},
+        "jobs": [
+            {"output": "midnight.dot", "theme": "midnight"},
+            {"output": "oob.dot", "filter": "-oob", "mark": ["-oob$"], "dir": "TB", "head": False},
+            {"output": "fw.html", "root": "acmefw", "theme": "hotdog"},
+        ],
+    },
+}
+BATCH_SPECS["hosts_jobs_more"] = {
+    **BATCH_SPECS["hosts_jobs"],
+    # A new build group, so it is queued after every hit was read
+    "jobs": BATCH_SPECS["hosts_jobs"]["jobs"] + [{"output": "fw-safe.dot", "theme": "safe", "filter": "fw"}],
+}
+
+# ---------------------------------------------------------------------------
+# Test cases: (name, argv, stdin)
+# ---------------------------------------------------------------------------
+
+CASES = [
+    # Character-mode tests
+    ("hosts_default",                 ["--sample-hosts"], None),
+    ("hosts_TB",                      ["--sample-hosts", "-d", "TB"], None),
+    ("hosts_head",                    ["--sample-hosts", "-H"], None),
+    ("hosts_mark_nothing",            ["--sample-hosts", "-M", ""], None),
+    ("hosts_mark_srv",                ["--sample-hosts", "-M", "srv"], None),
+    ("hosts_mark_fw_and_sw",          ["--sample-hosts", "-M", "fw", "sw"], None),
+    ("hosts_filter_fw",               ["--sample-hosts", "-f", "fw"], None),
+    ("hosts_filter_fw_invert",        ["--sample-hosts", "-f", "fw", "--invert-filter"], None),
+    ("hosts_filter_anchored_invert",  ["--sample-hosts", "-f", "^acmefw", "--invert-filter"], None),
+    ("hosts_ignore_case",             ["--sample-hosts", "--ignore-case"], None),
+    ("hosts_keep_prefix",             ["--sample-hosts", "--keep-prefix"], None),
+    ("hosts_keep_prefix_ignore_case", ["--sample-hosts", "--keep-prefix", "--ignore-case"], None),
+    ("hosts_keep_fqdn",               ["--sample-hosts", "--keep-fqdn"], None),
+    ("hosts_no_labels",               ["--sample-hosts", "--no-labels"], None),
+    ("hosts_root",                    ["--sample-hosts", "--root", "acmefw"], None),
+
+    # head sorting using nato
+    ("nato_head",                     ["--sample-nato", "-H"], None),
+
+    # head + no-labels (important behaviour case)
+    ("hosts_head_no_labels",          ["--sample-hosts", "-H", "--no-labels"], None),
+
+    # Token-mode tests
+    ("ips_token",                     ["--sample-ips", "-D", "."], None),
+    ("paths_token",                   ["--sample-paths", "-D", "/"], None),
+    ("urls_token",                    ["--sample-urls", "-D", "/"], None),
+    ("emails_token",                  ["--sample-emails", "-D", "@", "--rtl"], None),
+
+    # head-mode ignored in token-mode
+    ("ips_token_head_ignored",        ["--sample-ips", "-D", ".", "-H"], None),
+
+    # deeper marking in token-mode
+    ("paths_token_mark_share",        ["--sample-paths", "-D", "/", "-M", "share"], None),
+
+    # subtree selection in token-mode
+    ("ips_token_root_ancestors",      ["--sample-ips", "-D", ".", "--root", "10.20", "--root-ancestors"], None),
+
+    # mixed-case token-mode + ignore-case
+    ("paths_mixed_case_ignore",       ["--sample-paths", "-D", "/", "--ignore-case"], None),
+
+    # Token-mode corner cases: empty input (should not crash)
+    ("empty_token_input",             ["-D", "."], "\n"),
+
+    # Combined multiple datasets + delimiter + filter
+    ("combined_filter_token",         ["--sample-hosts", "--sample-ips", "-D", ".", "-f", "192"], None),
+
+    # Combined samples (character-mode + token-mode)
+    ("combined_hosts_ips",            ["--sample-hosts", "--sample-ips", "-D", "."], None),
+    ("combined_hosts_paths",          ["--sample-hosts", "--sample-paths", "-D", "/"], None),
+
+    # Diff mode
+    ("diff_hosts",                    ["--diff", "fixture:hosts_old", "fixture:hosts_new"], None),
+    ("diff_hosts_only_changed",       ["--diff-only", "--diff", "fixture:hosts_old", "fixture:hosts_new"], None),
+    ("diff_ips_token",                ["-D", ".", "--diff", "fixture:ips_old", "fixture:ips_new"], None),
+    ("diff_hosts_normalised",         ["-i", "--diff", "fixture:hosts_fqdn_old", "fixture:hosts_fqdn_new"], None),
+    ("diff_hosts_normalised_only_changed", ["-i", "--diff-only", "--diff", "fixture:hosts_fqdn_old", "fixture:hosts_fqdn_new"], None),
+    # Keys that are a prefix of another key keep their own status
+    ("diff_ips_token_prefix_added",   ["-D", ".", "--diff", "fixture:ips_prefix_old", "fixture:ips_prefix_new"], None),
+    ("diff_ips_token_prefix_removed", ["-D", ".", "--diff", "fixture:ips_prefix_new", "fixture:ips_prefix_old"], None),
+    ("diff_ips_token_prefix_only_changed", ["-D", ".", "--diff-only", "--diff", "fixture:ips_prefix_old", "fixture:ips_prefix_new"], None),
+    # -M matches the normalised line for unchanged keys too
+    ("diff_urls_normalize_mark_only_changed", ["--normalize", "urls", "-M", "^example.com/app$", "--diff-only",
+                                           "--diff", "fixture:urls_old", "fixture:urls_new"], None),
+
+    # Theme sanity tests
+    ("theme_default",                 ["--sample-hosts", "-T", "default"], None),
+    ("theme_midnight",                ["--sample-hosts", "-T", "midnight"], None),
+    ("theme_hotdog",                  ["--sample-hosts", "-T", "hotdog"], None),
+    ("theme_tacky",                   ["--sample-hosts", "-T", "tacky-test"], None),
+    ("theme_none",                    ["--sample-hosts", "-T", "none"], None),
+
+    # Override tests (only ONE of each type is needed)
+    ("override_all_colours",
+        ["--sample-hosts", "-cn", "red", "-cm", "green", "-ch", "blue", "-ce", "orange", "-cp", "purple"], None),
+    ("override_all_text",
+        ["--sample-hosts", "-tn", "red", "-tm", "green", "-th", "blue"], None),
+    ("font_menlo",                    ["--sample-hosts", "-F", "menlo"], None),
+
+    # Layout tuning (small tries keep the default header)
+    ("hosts_large_graph",             ["--sample-hosts", "--large-graph"], None),
+
+    # Compact node IDs
+    ("hosts_head_short_ids",          ["--sample-hosts", "-H", "--short-ids"], None),
+    ("paths_token_short_ids",         ["--sample-paths", "-D", "/", "--short-ids"], None),
+
+    # Minimised DAWG: shared suffixes drawn once, marks kept apart
+    ("hosts_dawg",                    ["--sample-hosts", "--dawg"], None),
+    ("paths_token_dawg",              ["--sample-paths", "-D", "/", "--dawg"], None),
+
+    # Memory budget fallbacks (the samples need ~9K of node store)
+    ("hosts_memory_summary",          ["--sample-hosts", "--max-memory", "6K", "--on-memory-limit", "summary"], None),
+    ("paths_token_memory_prune",      ["--sample-paths", "-D", "/", "--max-memory", "2K", "--on-memory-limit", "prune"], None),
+
+    # Plan reports instead of DOT
+    ("hosts_plan",                    ["--sample-hosts", "--plan"], None),
+    ("ips_token_plan_root",           ["--sample-ips", "-D", ".", "--root", "10", "--plan"], None),
+    ("hosts_plan_dawg",               ["--sample-hosts", "--plan", "--dawg"], None),
+
+    # Canonical forms from --normalize (implied delimiters)
+    ("urls_normalize",                ["--sample-urls", "--normalize", "urls"], None),
+    ("emails_normalize",              ["--sample-emails", "--normalize", "emails"], None),
+    ("ips_normalize",                 ["--normalize", "ips"],
+        "010.000.000.001\n10.0.0.1\n192.168.001.010/24\n2001:DB8:0::1\nnot-an-ip\n"),
+    ("hosts_normalize_fqdn",          ["--sample-hosts", "--normalize", "hosts", "--keep-fqdn"], None),
+
+    # Key and mark flag read from structured records
+    ("hosts_csv_column_mark",         ["fixture:inventory", "--csv-column", "hostname", "--csv-delimiter", ";",
+                                       "--mark-field", "oob"], None),
+    ("ips_json_field",                ["fixture:flows", "--json-field", "src.ip", "-D", "."], None),
+
+    # Terminal attributes joined from a CSV (keys normalised like the input)
+    ("hosts_meta_ignore_case",        ["--sample-hosts", "-i", "--meta", "fixture:cmdb",
+                                       "--meta-style", "colour=fillcolor", "--meta-style", "owner=tooltip"], None),
+
+    # One parse, several outputs (job values starting with "-" stay values)
+    ("hosts_batch",                   ["--sample-hosts", "--batch", "batch:hosts_jobs", "-j", "2"], None),
+
+    # One file per branch plus a linked index. Shard names that only differ
+    # in case are numbered, and the marked shard root keeps its class.
+    ("tokens_split_head",             ["-D", ".", "-M", "^acme$", "--split-by", "head", "-o", "outdir:split_head"],
+                                      "Acme.fw01\nAcme.fw02\nacme.sw01\nacme.sw02\nacme\nACME.lab\nweb\n"),
+
+    # Sliding window over a timestamped log (only the final snapshot)
+    ("hosts_window",                  ["fixture:events", "--time-field", "1", "--window", "5m", "--window-step", "0"], None),
+    ("hosts_window_late_lines",       ["fixture:events_late", "--time-field", "1", "--window", "60", "--window-step", "0"], None),
+
+    # Interactive HTML viewer (golden holds the page)
+    ("hosts_head_html",               ["--sample-hosts", "-H", "--format", "html"], None),
+    ("emails_token_html",             ["--sample-emails", "-D", "@", "--rtl", "-T", "midnight", "--format", "html"], None),
+
+    # Streaming output for presorted input (keys sorted after normalisation)
+    ("hosts_head_assume_sorted",      ["--assume-sorted", "-H"],
+        "acmefw01\nacmefw01-oob\nacmefw02\nACME\\acmesrv01\nacmesw01.domain.local\nacmeweb01\nlocalhost\n"),
+    ("ips_token_assume_sorted",       ["--assume-sorted", "-D", "."],
+        "10.0.0.1\n10.0.0.2\n10.0.1.20\n10.20.30.40\n192.168.0.1\n192.168.1.1\n8.8.8.8\n"),
+    # Verbatim `LC_ALL=C sort -u` output: "-" and "." sort before "/"
+    ("hosts_lc_sort_assume_sorted",   ["--assume-sorted", "-H"],
+        "acme-fw.local\nacme.local\nacmefw01\nacmefw01-oob.domain.local\nacmefw01.domain.local\n"
+        "acmefw010.domain.local\nacmesw01.domain.local\n"),
+    ("hosts_token_lc_sort_assume_sorted", ["--assume-sorted", "-D", "."],
+        "acme-fw.local\nacme.local\nacmefw01\nacmefw01-oob.domain.local\nacmefw01.domain.local\n"
+        "acmefw010.domain.local\nacmesw01.domain.local\n"),
+    ("paths_lc_sort_assume_sorted",   ["--assume-sorted", "-D", "/"],
+        "/usr\n/usr-local/bin\n/usr/lib\n/usr/lib-x/z\n/usr/lib.d/x\n/usr/lib/y\n/usr/lib/y/z\n/usr/lib/y/z.d\n"),
+]
+
+# Snapshot round trips: (name, build argv, view argv). `--freeze` with the
+# build options, then `--snapshot` with the view options, must write the same
+# DOT as one run with both.
+ROUND_TRIPS = [
+    ("hosts_head_snapshot",           ["--sample-hosts", "-H"], []),
+    ("hosts_snapshot_root",           ["--sample-hosts", "-i"], ["--root", "acmefw", "-T", "midnight"]),
+    ("ips_token_snapshot_root",       ["--sample-ips", "-D", "."], ["--root", "10", "--root-ancestors"]),
+    ("paths_token_snapshot_root",     ["--sample-paths", "-D", "/"], ["--root", "usr", "--short-ids"]),
+]
+
+# Output cache: (name, (argv, stdin), (argv, stdin), hits). The first run
+# fills an empty cache and its entries are then overwritten with a marker;
+# the second run must write the marker for exactly `hits` outputs.
+CACHE_MARKER = "served from the cache\n"
+CACHE_RUNS = [
+    ("cache_hit",                     (["--cache"], "acmefw01\nacmesw01\n"),
+                                      (["--cache"], "acmesw01\nacmefw01\nacmefw01\n"), 1),
+    ("cache_changed_input",           (["--cache"], "acmefw01\nacmesw01\n"),
+                                      (["--cache"], "acmefw01\nacmesw02\n"), 0),
+    ("cache_changed_theme",           (["--sample-hosts", "--cache"], None),
+                                      (["--sample-hosts", "--cache", "-T", "midnight"], None), 0),
+    ("batch_cache_hit",               (["--sample-hosts", "--cache", "--batch", "batch:hosts_jobs", "-j", "3"], None),
+                                      (["--sample-hosts", "--cache", "--batch", "batch:hosts_jobs", "-j", "3"], None), 3),
+    ("batch_cache_changed_input",     (["--cache", "--batch", "batch:hosts_jobs"], "acmefw01\nacmesw01\n"),
+                                      (["--cache", "--batch", "batch:hosts_jobs"], "acmefw01\nacmesw02\n"), 0),
+    # The new job's put() empties a zero-size cache while the hits are
+    # still queued; they must be written from the entries already read
+    ("batch_cache_evicted_hits",      (["--sample-hosts", "--cache", "--batch", "batch:hosts_jobs"], None),
+                                      (["--sample-hosts", "--cache", "--cache-size", "0", "--batch",
+                                        "batch:hosts_jobs_more", "-j", "4"], None), 3),
+]
+
+# --watch: (name, steps, rewrites, open files). Each step changes a file in
+# a watched directory before one poll: ("append", file, text), ("rotate",
+# file, text) to replace it with a new file, or ("remove", file, None).
+# The output must be rewritten exactly `rewrites` times, and the follower
+# must end with `open files` handles.
+WATCH_RUNS = [
+    # Repeated keys and a partial line completing to one leave the trie as is
+    ("watch_rewrite_on_change",       [("append", "a.log", "acmefw01\nacmesw01\n"),
+                                       ("append", "a.log", "acmefw01\n"),
+                                       ("append", "a.log", "acmesw"),
+                                       ("append", "a.log", "01\n")], 1, 1),
+    ("watch_rotation",                [("append", "a.log", "acmefw01\n"),
+                                       ("rotate", "a.log", "acmefw01\n"),
+                                       ("rotate", "a.log", "acmesw01\n")], 2, 1),
+    ("watch_removed_file",            [("append", "a.log", "acmefw01\n"),
+                                       ("append", "b.log", "acmesw01\n"),
+                                       ("remove", "b.log", None)], 2, 1),
+]
+
+# ---------------------------------------------------------------------------
+# Running cases
+# ---------------------------------------------------------------------------
+
+def write_batch_spec(name, fixture_dir):
+    """
+    Write BATCH_SPECS[name] with its outputs moved into `fixture_dir`.
+    Return the spec path and the output paths in job order.
+    """
+    spec = json.loads(json.dumps(BATCH_SPECS[name]))
+    outputs = []
+    for job in spec["jobs"]:
+        job["output"] = str(fixture_dir / job["output"])
+        outputs.append(Path(job["output"]))
+
+    path = fixture_dir / f"{name}.json"
+    path.write_text(json.dumps(spec))
+    return str(path), outputs
+
+def run_case(argv, stdin, fixture_dir):
+    """
+    Run tries.main() in-process and return its stdout, followed by the
+    outputs of a batch:NAME spec or the files written to an outdir:NAME
+    directory (in name order).
+    """
+    outputs = []
+    outdir = None
+    argv = list(argv)
+    for i, a in enumerate(argv):
+        if a.startswith("fixture:"):
+            argv[i] = str(fixture_dir / a.split(":", 1)[1])
+        elif a.startswith("batch:"):
+            argv[i], outputs = write_batch_spec(a.split(":", 1)[1], fixture_dir)
+        elif a.startswith("outdir:"):
+            outdir = fixture_dir / a.split(":", 1)[1]
+            argv[i] = str(outdir)
+
+    out = io.StringIO()
+    saved_stdin = sys.stdin
+    sys.stdin = io.StringIO(stdin or "")
+    try:
+        with contextlib.redirect_stdout(out):
+            tries.main(argv)
+    finally:
+        sys.stdin = saved_stdin
+
+    if outdir is not None:
+        outputs = sorted(outdir.iterdir())
+    for path in outputs:
+        out.write(f"// {path.name}\n{path.read_text()}\n")
+    return out.getvalue()
+
+def run_round_trip(build, view, fixture_dir):
+    """
+    Return the DOT of a direct run and of the same trie frozen and reloaded.
+    """
+    snapshot = fixture_dir / "round-trip.snap"
+    direct = run_case(build + view, None, fixture_dir)
+    run_case(build + ["--freeze", str(snapshot)], None, fixture_dir)
+    return direct, run_case(["--snapshot", str(snapshot)] + view, None, fixture_dir)
+
+def run_cache_case(first, second, fixture_dir):
+    """
+    Run `first` against an empty cache, mark its entries, then run `second`.
+    Return how many of the second run's outputs came from the cache.
+    """
+    share = fixture_dir / "share"
+    saved = {k: os.environ.pop(k, None) for k in ("PREFIX", "XDG_DATA_HOME", "TRIES_CACHE")}
+    os.environ["XDG_DATA_HOME"] = str(share)
+    try:
+        run_case(*first, fixture_dir)
+        entries = list((share / "tries" / "cache").iterdir())
+        if not entries:
+            return None
+        for entry in entries:
+            entry.write_text(CACHE_MARKER)
+        return run_case(*second, fixture_dir).count(CACHE_MARKER)
+    finally:
+        os.environ.pop("XDG_DATA_HOME")
+        os.environ.update({k: v for k, v in saved.items() if v is not None})
+        shutil.rmtree(share, ignore_errors=True)
+
+class WatchScript(tries.Follower):
+    """
+    A Follower that applies one scripted step before each poll and stops
+    watch() once the steps run out.
+    """
+
+    class Done(Exception):
+        pass
+
+    def __init__(self, directory, steps):
+        super().__init__([directory])
+        self.directory = directory
+        self.steps = list(steps)
+
+    def poll(self):
+        if not self.steps:
+            raise self.Done()
+
+        action, name, text = self.steps.pop(0)
+        path = self.directory / name
+        if action == "append":
+            with path.open("a") as fp:
+                fp.write(text)
+        elif action == "rotate":
+            (self.directory / ".next").write_text(text)
+            os.replace(self.directory / ".next", path)
+        else:
+            path.unlink()
+        return super().poll()
+
+def run_watch_case(steps, fixture_dir, name):
+    """
+    Watch an empty directory through `steps`. Return how many times the
+    output was rewritten and how many files the follower still has open.
+    """
+    directory = fixture_dir / name
+    directory.mkdir()
+    builder = tries.new_builder(tries.parse_args(["--watch", str(directory), "-o", "-"]))
+    follower = WatchScript(directory, steps)
+    rewrites = []
+    try:
+        tries.watch(builder, follower, lambda line: True, lambda: rewrites.append(1), interval=0, debounce=0)
+    except WatchScript.Done:
+        pass
+    return len(rewrites), len(follower.state)
+
+def render_png(name, dot):
+    dotfile = OUTDIR / f"{name}.dot"
+    pngfile = OUTDIR / f"{name}.png"
+    dotfile.write_text(dot)
+    subprocess.run(["dot", "-Tpng", str(dotfile), "-o", str(pngfile)], check=True)
+    return name
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="run-tests.py",
+        description="Run the tries.py feature tests against golden DOT files.",
+    )
+    parser.add_argument("cases", nargs="*", help="Only run these cases.")
+    parser.add_argument("--update", action="store_true", help="Rewrite golden files.")
+    parser.add_argument("--png", action="store_true", help="Also render PNGs into EXAMPLES/tests/.")
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Parallel Graphviz renders for --png (default: CPU count).",
+    )
+    args = parser.parse_args(argv)
+
+    known = {name for name, _, _ in CASES + ROUND_TRIPS} | {c[0] for c in CACHE_RUNS + WATCH_RUNS}
+    unknown = [c for c in args.cases if c not in known]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+    selected = [c for c in CASES if not args.cases or c[0] in args.cases]
+    trips = [c for c in ROUND_TRIPS if not args.cases or c[0] in args.cases]
+    caches = [c for c in CACHE_RUNS if not args.cases or c[0] in args.cases]
+    watches = [c for c in WATCH_RUNS if not args.cases or c[0] in args.cases]
+
+    GOLDEN.mkdir(exist_ok=True)
+    if args.png:
+        OUTDIR.mkdir(parents=True, exist_ok=True)
+
+    failed = []
+    with tempfile.TemporaryDirectory() as tmp, ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        fixture_dir = Path(tmp)
+        for fname, text in FIXTURES.items():
+            (fixture_dir / fname).write_text(text)
+
+        renders = []
+        for name, case_argv, stdin in selected:
+            dot = run_case(case_argv, stdin, fixture_dir)
+            golden = GOLDEN / f"{name}.dot"
+
+            if args.update:
+                golden.write_text(dot)
+                print(f"  updated  {name}")
+            elif not golden.exists():
+                failed.append(name)
+                print(f"  MISSING  {name} (run with --update)")
+            elif golden.read_text() != dot:
+                failed.append(name)
+                print(f"  FAIL     {name}")
+                diff = difflib.unified_diff(
+                    golden.read_text().splitlines(),
+                    dot.splitlines(),
+                    f"golden/{name}.dot",
+                    "output",
+                    lineterm="",
+                )
+                for line in list(diff)[:40]:
+                    print(f"           {line}")
+            else:
+                print(f"  ok       {name}")
+
+            if args.png:
+                renders.append(pool.submit(render_png, name, dot))
+
+        for future in renders:
+            future.result()
+
+        # Round trips compare two runs, so --update has nothing to write
+        for name, build, view in trips:
+            direct, reloaded = run_round_trip(build, view, fixture_dir)
+            if direct != reloaded:
+                failed.append(name)
+                print(f"  FAIL     {name}")
+                diff = difflib.unified_diff(
+                    direct.splitlines(),
+                    reloaded.splitlines(),
+                    "direct",
+                    "snapshot",
+                    lineterm="",
+                )
+                for line in list(diff)[:40]:
+                    print(f"           {line}")
+            else:
+                print(f"  ok       {name}")
+
+        for name, first, second, hits in caches:
+            served = run_cache_case(first, second, fixture_dir)
+            if served != hits:
+                failed.append(name)
+                print(f"  FAIL     {name} ({served} outputs from the cache, expected {hits})")
+            else:
+                print(f"  ok       {name}")
+
+        for name, steps, rewrites, handles in watches:
+            result = run_watch_case(steps, fixture_dir, name)
+            if result != (rewrites, handles):
+                failed.append(name)
+                print(f"  FAIL     {name} ({result[0]} rewrites and {result[1]} open files, "
+                      f"expected {rewrites} and {handles})")
+            else:
+                print(f"  ok       {name}")
+
+    print()
+    print(f"{len(selected) + len(trips) + len(caches) + len(watches) - len(failed)} passed, {len(failed)} failed")
+    if args.png:
+        print(f"PNGs: {OUTDIR.relative_to(HERE)}/")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# vim: set ts=4 sw=4 expandtab:
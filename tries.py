@@ -12,17 +12,59 @@
 #      * Sample data flags (--sample-hosts, --sample-ips, --sample-paths, --sample-urls, --sample-emails, --sample-nato)
 #      * Combined input: samples + files + stdin
 #      * Theme loading, dumping, and saving support
+#      * Subtree selection via --root
+#      * Watch mode (--watch) with incremental updates and atomic output
+#      * Diff mode (--diff OLD NEW) colouring added and removed terminals
+#      * Batch mode (--batch SPEC): many outputs from one parse
+#      * Opt-in content-addressed output cache (--cache)
+#      * Size-aware Graphviz layout tuning (--large-graph)
+#      * Per-branch DOT shards plus an index graph (--split-by)
+#      * Read-only array-backed trie snapshots (--freeze / --snapshot)
+#      * Node store memory budget with prune/summary fallback (--max-memory)
+#      * Input read on a background thread, overlapping I/O with dedupe
+#      * Throttled progress and ETA on stderr (--progress)
+#      * Trie shape analytics and cost estimate without output (--plan)
+#      * Optional NumPy sort/LCP bulk build for character mode (--engine)
+#      * Streaming DOT output for presorted input (--assume-sorted)
+#      * Lazy-expanding interactive HTML viewer (--format html)
+#      * Per-terminal attributes joined from a CSV (--meta)
+#      * Sliding time-window tries over timestamped logs (--window)
+#      * Anchored -f prefixes and --root checked while inserting, not per regex
+#      * Memoised host/URL/email/IP normalisation (--normalize)
+#      * Minimised DAWG output sharing identical suffix subtrees (--dawg)
+#      * Key (and mark flag) columns read straight from CSV or JSON lines
 #
 #    Clarity is prioritised over cleverness.
 
 import argparse
+import contextlib
+import csv
+import datetime
+import functools
+import hashlib
+import heapq
+import io
+import ipaddress
+import itertools
+import json
+import math
+import mmap
+import queue
 import re
+import struct
 import sys
 import unicodedata
 import os
 import runpy
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 __version__ = "4.3.0"
 
@@ -57,6 +99,12 @@ FALLBACK_THEMES = {
     }
 }
 
+# Diff colors for themes that do not define "added" / "removed"
+FALLBACK_DIFF_COLORS = {
+    "added": "springgreen",
+    "removed": "salmon",
+}
+
 FALLBACK_FONTS = {
     "courier": "Courier",
     "menlo": "Menlo",
@@ -90,6 +138,19 @@ def load_support_file(name):
                 pass
     return None
 
+def share_dir() -> Path:
+    """
+    Writable data directory for custom themes and the output cache.
+    """
+    prefix_env = os.environ.get("PREFIX", None)
+    if prefix_env and prefix_env != str(Path.home()):
+        return Path(prefix_env) / "share" / "tries"
+
+    xdg = os.environ.get("XDG_DATA_HOME")
+    if xdg:
+        return Path(xdg) / "tries"
+    return Path.home() / ".local" / "share" / "tries"
+
 # ---------------------------------------------------------------------------
 # Load and merge themes
 # ---------------------------------------------------------------------------
@@ -139,6 +200,81 @@ def dbg(enabled: bool, msg: str) -> None:
     if enabled:
         sys.stderr.write(f"[DEBUG] {msg}\n")
 
+# ---------------------------------------------------------------------------
+# Progress reporting (--progress)
+# ---------------------------------------------------------------------------
+
+PROGRESS_INTERVAL = 1.0
+
+def clock(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+class Progress:
+    """
+    Periodic one-line status on stderr.
+
+    Callers ask due() between batches (or every few thousand lines), which
+    only compares the clock against the next report time, so a disabled or
+    idle reporter costs almost nothing. On a terminal the line is redrawn
+    in place; otherwise each report is its own line.
+    """
+
+    def __init__(self, enabled: bool, interval: float = PROGRESS_INTERVAL):
+        self.enabled = enabled
+        self.interval = interval
+        self.start = time.monotonic()
+        self.next = self.start + interval
+        self.tty = enabled and sys.stderr.isatty()
+        self.pending = False
+
+    def due(self) -> bool:
+        return self.enabled and time.monotonic() >= self.next
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def eta(self, done: float, total: Optional[float]) -> str:
+        if not total or done <= 0:
+            return ""
+        remaining = self.elapsed() * (total - done) / done
+        return f", {100 * done / total:.0f}%, ETA {clock(max(remaining, 0))}"
+
+    def show(self, stage: str, text: str) -> None:
+        line = f"tries.py: {stage}: {text}, {clock(self.elapsed())} elapsed"
+        if self.tty:
+            sys.stderr.write(f"\r\x1b[K{line}")
+            self.pending = True
+        else:
+            sys.stderr.write(line + "\n")
+        sys.stderr.flush()
+        self.next = time.monotonic() + self.interval
+
+    def finish(self, stage: str, text: str) -> None:
+        """
+        Report the end of a stage unconditionally.
+        """
+        if self.enabled:
+            self.show(stage, text)
+            if self.pending:
+                sys.stderr.write("\n")
+                self.pending = False
+
+def input_size(files) -> Optional[int]:
+    """
+    Total size of the input files (or stdin) if all are regular files.
+    """
+    total = 0
+    for f in files or [sys.stdin]:
+        try:
+            st = os.fstat(f.fileno())
+        except (AttributeError, OSError, ValueError):
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        total += st.st_size
+    return total
+
 # ---------------------------------------------------------------------------
 # DOT escaping
 # ---------------------------------------------------------------------------
@@ -211,27 +347,390 @@ def extract_hostname(raw: str, keep_prefix: bool, keep_fqdn: bool) -> str:
     tmp = tmp.lstrip("\\/").strip()
     return tmp
 
+# ---------------------------------------------------------------------------
+# Input normalisation (--normalize)
+# ---------------------------------------------------------------------------
+
+NORMALIZERS = ["hosts", "urls", "emails", "ips"]
+
+# Delimiter each kind implies when -D is not given (hosts stay in character mode)
+NORMALIZE_DELIMS = {"hosts": None, "urls": "/", "emails": "@", "ips": "."}
+
+# Parsed lines remembered per run; --watch and --window see the same lines again
+NORMALIZE_CACHE = 1 << 16
+
+# [scheme:]//[user@]host[:port]/path, with query and fragment left unmatched
+URL_PATTERN = re.compile(
+    r"(?:(?:(?P<scheme>[A-Za-z][A-Za-z0-9+.-]*):)?//)?"
+    r"(?:[^/?#@]*@)?"
+    r"(?P<host>\[[^\]/?#]*\]|[^/?#:]*)"
+    r"(?::(?P<port>[0-9]*))?"
+    r"(?P<path>[^?#]*)"
+)
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+# user@domain, optionally as mailto: or inside "Name <...>"
+EMAIL_PATTERN = re.compile(r"(?i:mailto:)?([^\s<>]+)@([^\s<>@]+?)\.?(?:>|$)")
+
+IPV4_PATTERN = re.compile(r"(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})(?:/(\d{1,3}))?")
+
+def normalize_url(line: str) -> str:
+    """
+    https://Example.com:443/app/api?x=1 -> example.com/app/api
+
+    The scheme, user info, default port, query and fragment are dropped
+    and the host is lowercased; paths keep their case.
+    """
+    m = URL_PATTERN.match(line)
+    host = m["host"].lower().rstrip(".")
+    port = m["port"]
+    if port and port != DEFAULT_PORTS.get((m["scheme"] or "").lower()):
+        host += ":" + port
+    return "/".join(s for s in [host, *m["path"].split("/")] if s)
+
+def normalize_email(line: str) -> str:
+    """
+    Alice <alice@Example.com> -> example.com@alice
+
+    The domain comes first so addresses group by domain; it is lowercased,
+    the local part is kept as written. Lines without an address pass through.
+    """
+    m = EMAIL_PATTERN.search(line)
+    if not m:
+        return line
+    return f"{m[2].lower()}@{m[1]}"
+
+def normalize_ip(line: str) -> str:
+    """
+    010.000.001.020 -> 10.0.1.20, 2001:DB8:0::1 -> 2001:db8::1
+
+    An optional /prefix length is kept. Lines that are not addresses pass
+    through unchanged.
+    """
+    m = IPV4_PATTERN.fullmatch(line)
+    if m:
+        octets = [int(o) for o in m.groups()[:4]]
+        if max(octets) > 255 or (m[5] and int(m[5]) > 32):
+            return line
+        text = ".".join(map(str, octets))
+        return f"{text}/{int(m[5])}" if m[5] else text
+
+    addr, slash, bits = line.partition("/")
+    if slash and not bits.isdigit():
+        return line
+    try:
+        text = ipaddress.IPv6Address(addr).compressed
+    except ValueError:
+        return line
+    return f"{text}/{int(bits)}" if slash else text
+
+def normalizer(kind: str, keep_prefix: bool = False, keep_fqdn: bool = False):
+    """
+    Return the memoised --normalize parser for `kind`, taking a stripped
+    line and returning its canonical text. Hosts are cleaned as in
+    character mode, then lowercased without a trailing dot.
+    """
+    if kind == "hosts":
+        def parse(line: str) -> str:
+            return extract_hostname(line, keep_prefix, keep_fqdn).rstrip(".").lower()
+    else:
+        parse = {"urls": normalize_url, "emails": normalize_email, "ips": normalize_ip}[kind]
+    return functools.lru_cache(maxsize=NORMALIZE_CACHE)(parse)
+
+# ---------------------------------------------------------------------------
+# Structured input (--csv-column / --json-field)
+# ---------------------------------------------------------------------------
+
+# --mark-field values that leave a key unmarked (compared lowercased)
+FLAG_FALSE = {"", "0", "false", "no", "n", "off", "none", "null"}
+
+def csv_char(value: str) -> str:
+    """
+    argparse type for --csv-delimiter / --csv-quote: one character, or
+    'tab' / '\\t' for a tab.
+    """
+    if value in ("tab", "\\t"):
+        return "\t"
+    if len(value) != 1:
+        raise argparse.ArgumentTypeError(f"expected a single character, got '{value}'")
+    return value
+
+def flag_set(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() not in FLAG_FALSE
+    return bool(value) and not isinstance(value, (dict, list))
+
+def json_value(record, path: List[str]):
+    """
+    Follow a dotted --json-field path (list items by index) through a
+    decoded record. Return None where the path is missing.
+    """
+    for step in path:
+        if isinstance(record, dict):
+            record = record.get(step)
+        elif isinstance(record, list) and step.isdigit() and int(step) < len(record):
+            record = record[int(step)]
+        else:
+            return None
+    return record
+
+class RecordReader:
+    """
+    Pull the key field out of CSV rows or JSON lines while they are read,
+    instead of piping the input through cut or jq first.
+
+    CSV sources start with a header row; columns are picked by name, or by
+    1-based position. With --mark-field, keys whose flag field is set are
+    collected in `flagged` as read; new_builder() normalises them like
+    --meta keys. Records without the key are skipped.
+    """
+
+    def __init__(
+        self,
+        *,
+        csv_column: Optional[str] = None,
+        json_field: Optional[str] = None,
+        mark_field: Optional[str] = None,
+        delimiter: str = ",",
+        quotechar: str = '"',
+    ):
+        self.csv_column = csv_column
+        self.json_path = json_field.split(".") if json_field else None
+        self.mark_field = mark_field
+        self.mark_path = mark_field.split(".") if mark_field else None
+        self.delimiter = delimiter
+        self.quotechar = quotechar
+        self.flagged = set()
+
+    def read(self, fp, name: str):
+        if self.csv_column:
+            return self._csv(fp, name)
+        return self._json(fp, name)
+
+    def _csv(self, fp, name: str):
+        reader = csv.reader(fp, delimiter=self.delimiter, quotechar=self.quotechar)
+        header = next(reader, None)
+        if header is None:
+            return
+
+        key_at = self._column(header, self.csv_column, name)
+        flag_at = self._column(header, self.mark_field, name) if self.mark_field else None
+        flagged = self.flagged
+        for row in reader:
+            if key_at >= len(row):
+                continue
+            key = row[key_at].strip()
+            if not key:
+                continue
+            if flag_at is not None and flag_at < len(row) and flag_set(row[flag_at]):
+                flagged.add(key)
+            yield key
+
+    @staticmethod
+    def _column(header: List[str], column: str, name: str) -> int:
+        header = [h.strip() for h in header]
+        if column in header:
+            return header.index(column)
+        if column.isdigit() and 0 < int(column) <= len(header):
+            return int(column) - 1
+        sys.exit(f"tries.py: error: no column '{column}' in {name} (columns: {', '.join(header)})")
+
+    def _json(self, fp, name: str):
+        path = self.json_path
+        flagged = self.flagged
+        for number, line in enumerate(fp, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                sys.exit(f"tries.py: error: {name}:{number}: not a JSON record ({exc})")
+
+            key = json_value(record, path)
+            if key is None or isinstance(key, (dict, list, bool)):
+                continue
+            key = str(key).strip()
+            if not key:
+                continue
+            if self.mark_path and flag_set(json_value(record, self.mark_path)):
+                flagged.add(key)
+            yield key
+
+def record_reader(args) -> Optional[RecordReader]:
+    if not (args.csv_column or args.json_field):
+        return None
+    return RecordReader(
+        csv_column=args.csv_column,
+        json_field=args.json_field,
+        mark_field=args.mark_field,
+        delimiter=args.csv_delimiter,
+        quotechar=args.csv_quote,
+    )
+
 # ---------------------------------------------------------------------------
 # Input processing
 # ---------------------------------------------------------------------------
 
-def read_lines(files):
+def read_lines(files, records: Optional[RecordReader] = None):
     """
-    Yield lines from files, or stdin if no files are provided.
+    Yield lines from files, or stdin if no files are provided. With a
+    RecordReader, yield the key field of each record instead.
     """
     if not files:
+        if records:
+            yield from records.read(sys.stdin, "<stdin>")
+            return
         for line in sys.stdin:
             yield line.rstrip("\n")
         return
 
     for f in files:
         with f:
+            if records:
+                yield from records.read(f, f.name)
+                continue
             for line in f:
                 yield line.rstrip("\n")
 
-def filter_lines(lines, regex):
-    pat = re.compile(regex)
-    return [l for l in lines if pat.search(l)]
+# Lines per batch handed from the reader thread, and how many batches may
+# wait in the queue before the reader blocks (about 0.5M lines)
+READ_BATCH_LINES = 8192
+READ_QUEUE_BATCHES = 64
+
+def read_batches(files, batch_size=READ_BATCH_LINES, depth=READ_QUEUE_BATCHES, records=None):
+    """
+    Yield lists of lines from read_lines(files, records), read on a
+    background thread.
+
+    The reader fills a bounded queue, so waiting on a slow source (a pipe,
+    a network mount) overlaps with the caller's processing, and a slow
+    caller blocks the reader instead of buffering the whole input. Reader
+    errors are re-raised here; closing the generator stops the reader.
+    """
+    batches = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def reader():
+        try:
+            batch = []
+            for line in read_lines(files, records):
+                batch.append(line)
+                if len(batch) >= batch_size:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch and not put(batch):
+                return
+            put(done)
+        except BaseException as exc:
+            put(exc)
+
+    thread = threading.Thread(target=reader, name="tries-reader", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is done:
+                thread.join()
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+def unique_lines(batches, progress=None, size: Optional[int] = None):
+    """
+    Strip and dedupe batches of lines. Return (raw line count, set).
+
+    With a Progress, reports lines read and, when the input `size` in
+    bytes is known, an ETA from the characters seen so far.
+    """
+    count = 0
+    chars = 0
+    unique = set()
+    for batch in batches:
+        stripped = [line.strip() for line in batch]
+        stripped = [line for line in stripped if line]
+        count += len(stripped)
+        unique.update(stripped)
+
+        if size:
+            chars += sum(map(len, batch)) + len(batch)
+        if progress and progress.due():
+            progress.show("reading", reading_status(count, unique, progress) + progress.eta(chars, size))
+
+    if progress:
+        progress.finish("reading", reading_status(count, unique, progress))
+    return count, unique
+
+def reading_status(count, unique, progress) -> str:
+    # Rough size of the dedupe set: string objects plus set slots
+    avg = sum(map(len, itertools.islice(unique, 1000))) / max(1, min(len(unique), 1000))
+    mb = len(unique) * (100 + avg) / 2**20
+    rate = count / max(progress.elapsed(), 1e-9)
+    return f"{count:,} lines ({rate:,.0f}/s), {len(unique):,} unique, ~{mb:,.0f} MB"
+
+# Regex metacharacters; a backslash before anything else is a literal
+REGEX_SPECIAL = set(".^$*+?{}[]\\|()")
+
+def anchored_prefix(regex: str) -> Optional[str]:
+    """
+    Return the literal text of a `^prefix` pattern (optionally ending in
+    `.*`), or None for anything else. On single lines, such a pattern
+    matches exactly the lines that start with the text.
+    """
+    if not regex.startswith("^"):
+        return None
+    body = regex[1:]
+    if body.endswith(".*") and not body.endswith("\\.*"):
+        body = body[:-2]
+
+    text = []
+    i = 0
+    while i < len(body):
+        ch = body[i]
+        if ch == "\\":
+            if i + 1 == len(body) or body[i + 1].isalnum() or body[i + 1] == "_":
+                return None
+            text.append(body[i + 1])
+            i += 2
+        elif ch in REGEX_SPECIAL:
+            return None
+        else:
+            text.append(ch)
+            i += 1
+    return "".join(text)
+
+def line_filter(regex: str, invert: bool = False):
+    """
+    Return a predicate for -f/--invert-filter. Anchored literal prefixes
+    are checked with str.startswith() instead of a regex search.
+    """
+    if regex in ("", ".*"):
+        return lambda line: not invert
+
+    prefix = anchored_prefix(regex)
+    if prefix is not None:
+        return lambda line: line.startswith(prefix) != invert
+
+    search = re.compile(regex).search
+    return lambda line: bool(search(line)) != invert
+
+def filter_lines(lines, regex, invert=False):
+    return list(filter(line_filter(regex, invert), lines))
 
 def resolve_theme_values(args):
     parser = args._parser
@@ -244,234 +743,3280 @@ def resolve_theme_values(args):
     ce = args.color_edge   if args.color_edge   != parser.get_default("color_edge")   else th["edge"]
     cp = args.color_point  if args.color_point  != parser.get_default("color_point")  else th["point"]
 
+    # Diff colors (older themes have no entry for these)
+    ca = args.color_added   if args.color_added   != parser.get_default("color_added")   else th.get("added", FALLBACK_DIFF_COLORS["added"])
+    cr = args.color_removed if args.color_removed != parser.get_default("color_removed") else th.get("removed", FALLBACK_DIFF_COLORS["removed"])
+
     # Font colors
     tn = args.text_normal or th.get("text_normal")
     tm = args.text_mark   or th.get("text_mark")
     thh = args.text_head   or th.get("text_head")
 
-    return cn, cm, ch, ce, cp, tn, tm, thh
+    return cn, cm, ch, ce, cp, tn, tm, thh, ca, cr
+
+# Theme keys, in the order resolve_theme_values() returns them
+PALETTE_KEYS = (
+    "normal",
+    "mark",
+    "head",
+    "edge",
+    "point",
+    "text_normal",
+    "text_mark",
+    "text_head",
+    "added",
+    "removed",
+)
 
 # ---------------------------------------------------------------------------
 # Trie building
 # ---------------------------------------------------------------------------
 
-def trie(
-    lines: Iterable[str],
-    mark_patterns: List[str],
-    mark_is_default: bool,
-    head_mode: bool,
-    color_normal: Optional[str],
-    color_mark: Optional[str],
-    color_head: Optional[str],
-    keep_prefix: bool,
-    keep_fqdn: bool,
-    ignore_case: bool,
-    no_labels: bool,
-    text_normal: Optional[str],
-    text_mark: Optional[str],
-    text_head: Optional[str],
-    delim: Optional[str],
-    rtl: bool,
-):
-
-    edges = set()
-    node_meta: Dict[str, Dict[str, str]] = {}
+# Internal prefix nodes carry no label; they all share this one tuple
+POINT = ("point", None)
 
-    # Compile marking patterns
-    if mark_is_default:
-        patterns = [p if p.endswith("$") else p + "$" for p in mark_patterns]
-    else:
-        patterns = mark_patterns
+# Approximate bytes held per node by the builder (dict entries, edge
+# tuple, meta tuple), excluding the node ID string itself. Measured with
+# tracemalloc on large inputs.
+NODE_BYTES = 200
 
-    mark_regex = [re.compile(p) for p in patterns]
+MEMORY_STRATEGIES = ["abort", "prune", "summary"]
 
-    def marked(name: str) -> bool:
-        return any(p.search(name) for p in mark_regex)
+class MemoryBudgetError(RuntimeError):
+    """
+    Raised when the node store reaches --max-memory and cannot shrink.
+    """
 
-    # -------------------------------------------------------------
-    # TOKEN MODE
-    # -------------------------------------------------------------
-    if delim:
-        for raw in lines:
-            raw = raw.strip()
-            if not raw:
-                continue
+class TrieBuilder:
+    """
+    Incremental trie state.
 
-            tokens = [t for t in raw.split(delim) if t]
-            if not tokens:
-                continue
+    insert_lines() feeds a whole batch of lines through insert(); --watch
+    keeps one builder alive and inserts new lines as they arrive.
 
-            # Reverse token order if requested
-            if rtl:
-                tokens = list(reversed(tokens))
+    node_meta maps each node ID to (style class, label). Colors live in
+    the style classes (see style_classes()), so the trie itself does not
+    depend on the theme.
+    """
 
-            token_labels = tokens
-            tokens_norm = [t.lower() for t in tokens] if ignore_case else tokens
+    def __init__(
+        self,
+        *,
+        mark_patterns: List[str],
+        mark_is_default: bool,
+        head_mode: bool,
+        keep_prefix: bool,
+        keep_fqdn: bool,
+        ignore_case: bool,
+        no_labels: bool,
+        delim: Optional[str],
+        rtl: bool,
+        max_bytes: Optional[int] = None,
+        on_limit: str = "abort",
+        meta: Optional[Dict[str, Dict[str, str]]] = None,
+        normalize: Optional[str] = None,
+        diff: bool = False,
+    ):
+        self.head_mode = head_mode
+        self.keep_prefix = keep_prefix
+        self.keep_fqdn = keep_fqdn
+        self.ignore_case = ignore_case
+        self.no_labels = no_labels
+        self.delim = delim
+        self.rtl = rtl
+
+        self.edges = set()
+        self.node_meta: Dict[str, Tuple[str, Optional[str]]] = {}
+
+        # --normalize parses each line before it is split into tokens, and
+        # replaces the hostname clean-up of character mode
+        self.normalize = normalizer(normalize, keep_prefix, keep_fqdn) if normalize else None
+        self.hostname = self.normalize or functools.partial(
+            extract_hostname, keep_prefix=keep_prefix, keep_fqdn=keep_fqdn
+        )
+
+        # Per-terminal DOT attributes from --meta, keyed like key()
+        self.meta = meta
+
+        # --diff: lines carry an "added"/"removed" status (None: unchanged)
+        self.diff = diff
+
+        # Keys marked by --mark-field, keyed like key()
+        self.flagged = frozenset()
+
+        # --root pushdown (see restrict()): the root key, or its tokens
+        self.under = None
+        self.under_ancestors = False
+
+        # Memory budget (--max-memory). `bytes` is a running estimate of the
+        # node store; once it passes max_bytes, prune/summary cap the depth
+        # at max_depth and summary nodes count the keys cut off below them.
+        self.max_bytes = max_bytes
+        self.on_limit = on_limit
+        self.node_cost = NODE_BYTES
+        self.bytes = 0
+        self.lines = 0
+        self.max_depth: Optional[int] = None
+        self.summary: Dict[str, List] = {}
+
+        # Compile marking patterns
+        if mark_is_default:
+            patterns = [p if p.endswith("$") else p + "$" for p in mark_patterns]
+        else:
+            patterns = mark_patterns
+
+        self.mark_regex = [re.compile(p) for p in patterns]
+
+        if delim:
+            # Diff status of token nodes ("added", "removed" or None): of
+            # all lines through a node, and of the keys ending at it. Key
+            # nodes take the style of their keys, other nodes of their lines.
+            self.node_status: Dict[str, Optional[str]] = {}
+            self.key_status: Dict[str, Optional[str]] = {}
+
+            # mark trie as TOKEN MODE for rendering
+            self.node_meta["_delim_mode"] = True
+
+    def marked(self, name: str) -> bool:
+        return any(p.search(name) for p in self.mark_regex)
+
+    def restrict(self, root: str, ancestors: bool = False) -> bool:
+        """
+        Skip lines that cannot end up below `root` (or, with `ancestors`,
+        on the path to it) after comparing only the first characters or
+        tokens of their key. Return False and keep every line where that
+        could change the --root output: token-mode ancestors take their
+        labels from whichever line created them first, and a memory budget
+        depends on all lines.
+        """
+        key = root_key(root, self.delim, self.ignore_case)
+        if not key or self.max_bytes or (ancestors and self.delim):
+            return False
+
+        self.under = key.split(self.delim) if self.delim else key
+        self.under_ancestors = ancestors
+        return True
+
+    def _outside(self, key) -> bool:
+        under = self.under
+        if self.delim:
+            return key[:len(under)] != under
+        if key.startswith(under):
+            return False
+        return not (self.under_ancestors and under.startswith(key))
+
+    def key(self, raw: str) -> Optional[str]:
+        """
+        Return the ID of the node a line ends at, or None for no node.
+        """
+        raw = raw.strip()
+        if self.delim:
+            if self.normalize:
+                raw = self.normalize(raw)
+            tokens = [t for t in raw.split(self.delim) if t]
+            if self.rtl:
+                tokens.reverse()
+            name = self.delim.join(tokens)
+        else:
+            name = self.hostname(raw)
+        if not name:
+            return None
+        return name.lower() if self.ignore_case else name
+
+    def insert(self, raw: str, status: Optional[str] = None) -> bool:
+        """
+        Insert one input line. Return True if the trie changed.
+
+        `status` is the --diff tag of the line: "added", "removed", or None
+        for unchanged lines, which keep the normal/mark colors.
+        """
+        raw = raw.strip()
+        if not raw:
+            return False
 
-            is_marked = any(p.search(raw) for p in mark_regex)
-            fill = color_mark if is_marked else color_normal
-            text = text_mark if is_marked else text_normal
+        if self.delim:
+            changed = self._insert_tokens(raw, status)
+        else:
+            changed = self._insert_chars(raw, status)
 
-            parent = tokens_norm[0]
+        self.lines += 1
+        if self.max_bytes and self.bytes > self.max_bytes:
+            self._over_budget()
+        return changed
 
-            if parent not in node_meta:
-                nm = {"shape": "Mrecord"}
-                nm["label"] = "" if no_labels else token_labels[0]
-                if fill:
-                    nm["style"] = "filled"
-                    nm["fillcolor"] = fill
-                if text:
-                    nm["fontcolor"] = text
-                node_meta[parent] = nm
+    def _style(self, is_marked: bool, status: Optional[str]) -> str:
+        if status:
+            return status
+        return "mark" if is_marked else "normal"
 
-            for i in range(1, len(tokens_norm)):
-                token = tokens_norm[i]
-                child = parent + delim + token
+    # -------------------------------------------------------------
+    # TOKEN MODE
+    # -------------------------------------------------------------
+    def _insert_tokens(self, raw: str, status: Optional[str]) -> bool:
+        delim = self.delim
+        edges = self.edges
+        node_meta = self.node_meta
+
+        if self.normalize:
+            raw = self.normalize(raw)
+        tokens = [t for t in raw.split(delim) if t]
+        if not tokens:
+            return False
+
+        # Reverse token order if requested
+        if self.rtl:
+            tokens = list(reversed(tokens))
+
+        token_labels = tokens
+        tokens_norm = [t.lower() for t in tokens] if self.ignore_case else tokens
+        if self.under is not None and self._outside(tokens_norm):
+            return False
+        flagged = bool(self.flagged) and delim.join(tokens_norm) in self.flagged
+
+        cut = self.max_depth is not None and len(tokens) > self.max_depth
+        if cut:
+            tokens_norm = tokens_norm[:self.max_depth]
+
+        style = self._style(flagged or self.marked(raw), status)
+
+        changed = False
+        parent = None
+
+        for i, token in enumerate(tokens_norm):
+            child = token if parent is None else parent + delim + token
+
+            # A node's edge to its parent exists exactly as long as the node
+            if child in node_meta:
+                if self.node_status and status != self.node_status.get(child):
+                    changed |= self._merge_status(child)
+                parent = child
+                continue
 
+            if parent is not None:
                 edges.add((parent, child))
+            # Labels repeat across branches ("www", "usr", "com"): keep one copy
+            label = "" if self.no_labels else sys.intern(token_labels[i])
+            node_meta[child] = (style, label)
+            if status:
+                self.node_status[child] = status
+            self.bytes += self.node_cost + len(child)
+            changed = True
 
-                if child not in node_meta:
-                    nm = {"shape": "Mrecord"}
-                    nm["label"] = "" if no_labels else token_labels[i]
-                    if fill:
-                        nm["style"] = "filled"
-                        nm["fillcolor"] = fill
-                    if text:
-                        nm["fontcolor"] = text
-                    node_meta[child] = nm
-
-                parent = child
+            parent = child
 
-        # mark trie as TOKEN MODE for rendering
-        node_meta["_delim_mode"] = True
+        if cut and self.on_limit == "summary":
+            self._summarize(parent, token_labels[self.max_depth - 1])
+            changed = True
+        elif not cut:
+            if self.diff:
+                changed |= self._key_status(parent, style, status)
+            if self.meta:
+                changed |= self._attach_meta(parent)
+
+        return changed
+
+    def share(self, raw: str) -> None:
+        """
+        Mark the token nodes an unchanged line runs through as unchanged,
+        without adding any. --diff-only leaves unchanged lines out, but the
+        ancestors they share with changed lines are neither added nor removed.
+        """
+        name = self.key(raw)
+        if not name:
+            return
+
+        prefix = None
+        for token in name.split(self.delim):
+            prefix = token if prefix is None else prefix + self.delim + token
+            if prefix not in self.node_meta:
+                return
+            if self.node_status.get(prefix) is not None:
+                self._merge_status(prefix)
+
+        # -M matches the normalised line, as in _insert_tokens()
+        if self.normalize:
+            raw = self.normalize(raw.strip())
+        self._key_status(name, self._style(name in self.flagged or self.marked(raw), None), None)
+
+    def _attach_meta(self, name: str) -> bool:
+        attrs = self.meta.get(name)
+        if attrs is None:
+            return False
+        meta = self.node_meta[name]
+        self.node_meta[name] = meta[:2] + (attrs,)
+        return len(meta) < 3 or meta[2] is not attrs
+
+    def _merge_status(self, name: str) -> bool:
+        """
+        A token node shared by lines with different diff tags is unchanged.
+        """
+        if self.node_status.pop(name, None) is None or name in self.summary or name in self.key_status:
+            return False
+
+        self.node_meta[name] = ("normal",) + self.node_meta[name][1:]
+        return True
+
+    def _key_status(self, name: str, style: str, status: Optional[str]) -> bool:
+        """
+        Style a token node a key ends at after the key's diff tag, whatever
+        the lines through it are. Keys with different tags are unchanged.
+        """
+        if name not in self.key_status:
+            self.key_status[name] = status
+        elif self.key_status[name] != status:
+            self.key_status[name] = None
+            style = "normal"
+        else:
+            return False
 
-        return edges, node_meta
+        meta = self.node_meta[name]
+        if meta[0] == style:
+            return False
+        self.node_meta[name] = (style,) + meta[1:]
+        return True
 
     # -------------------------------------------------------------
     # CHARACTER MODE
     # -------------------------------------------------------------
-    for raw in lines:
-        raw = raw.strip()
-        if not raw:
-            continue
+    def _insert_chars(self, raw: str, status: Optional[str]) -> bool:
+        edges = self.edges
+        node_meta = self.node_meta
 
-        base = extract_hostname(raw, keep_prefix, keep_fqdn)
+        base = self.hostname(raw)
         if not base:
-            continue
+            return False
 
         label_text = base
-        base_norm = base.lower() if ignore_case else base
+        base_norm = base.lower() if self.ignore_case else base
+        if self.under is not None and self._outside(base_norm):
+            return False
+        flagged = base_norm in self.flagged
 
-        fill = color_mark if marked(base_norm) else color_normal
-        text = text_mark if marked(base_norm) else text_normal
+        cut = self.max_depth is not None and len(base_norm) > self.max_depth
+        if cut:
+            label_text = label_text[:self.max_depth]
+            base_norm = base_norm[:self.max_depth]
+
+        style = self._style(flagged or self.marked(base_norm), status)
 
         # Ensure the full hostname is always a terminal node.
         # If a prefix node already exists as a point (for example when
         # "acmefw01-oob" is seen before "acmefw01"), upgrade it to a
-        # terminal Mrecord without disturbing existing edges.
+        # terminal without disturbing existing edges.
         existing = node_meta.get(base_norm)
-        nm = dict(existing) if existing else {}
-        nm["shape"] = "Mrecord"
-        nm["label"] = "" if no_labels else label_text
-        if fill:
-            nm["style"] = "filled"
-            nm["fillcolor"] = fill
-        if text:
-            nm["fontcolor"] = text
-        node_meta[base_norm] = nm
+        if not cut:
+            nm = (style, "" if self.no_labels else label_text)
+            attrs = self.meta.get(base_norm) if self.meta else None
+            if attrs is not None:
+                nm += (attrs,)
+            node_meta[base_norm] = nm
+        elif self.on_limit == "summary":
+            nm = self._summarize(base_norm, label_text)
+        else:
+            # prune: keep the cut-off prefix as it is, or as a point if new
+            nm = node_meta.setdefault(base_norm, existing or POINT)
+
+        if existing is None:
+            self.bytes += self.node_cost + len(base_norm)
+        changed = nm != existing
 
         # Build all prefix nodes first, then apply terminal styling
         parent = base_norm[0]
 
         # Head node (single-character prefix) if needed
         if parent not in node_meta:
-            if head_mode:
-                attrs = {"shape": "circle"}
-                attrs["label"] = "" if no_labels else parent
-                if color_head:
-                    attrs["style"] = "filled"
-                    attrs["fillcolor"] = color_head
-                if text_head:
-                    attrs["fontcolor"] = text_head
-                node_meta[parent] = attrs
+            if self.head_mode:
+                node_meta[parent] = ("head", "" if self.no_labels else parent)
             else:
-                node_meta[parent] = {"shape": "point"}
+                node_meta[parent] = POINT
+            self.bytes += self.node_cost + 1
+            changed = True
 
         # Walk remaining characters, creating point nodes for internal prefixes
         for ch in base_norm[1:]:
             child = parent + ch
             edges.add((parent, child))
             if child not in node_meta:
-                node_meta[child] = {"shape": "point"}
+                node_meta[child] = POINT
+                self.bytes += self.node_cost + len(child)
+                changed = True
             parent = child
 
-    return edges, node_meta
+        return changed
+
+    # -------------------------------------------------------------
+    # EVICTION (--window)
+    # -------------------------------------------------------------
+    def remove(self, name: str) -> None:
+        """
+        Delete a node and the edge to its parent. The caller makes sure
+        no children are left below it.
+        """
+        del self.node_meta[name]
+        self.bytes -= self.node_cost + len(name)
+
+        depth = self._depth(name)
+        if depth > 1:
+            self.edges.discard((self._ancestor(name, depth - 1), name))
+
+        if self.delim:
+            self.node_status.pop(name, None)
+            self.key_status.pop(name, None)
+
+    # -------------------------------------------------------------
+    # MEMORY BUDGET
+    # -------------------------------------------------------------
+    def _depth(self, name: str) -> int:
+        if self.delim:
+            return name.count(self.delim) + 1
+        return len(name)
+
+    def _ancestor(self, name: str, depth: int) -> str:
+        if self.delim:
+            return self.delim.join(name.split(self.delim)[:depth])
+        return name[:depth]
+
+    def _summarize(self, name: str, text: str, keys: int = 1):
+        """
+        Count `keys` more keys cut off below `name` and relabel it.
+        """
+        entry = self.summary.setdefault(name, [0, text])
+        entry[0] += keys
+        nm = ("summary", "" if self.no_labels else f"{entry[1]}… (+{entry[0]})")
+        self.node_meta[name] = nm
+        return nm
+
+    def stats(self) -> str:
+        nodes = len(self.node_meta) - ("_delim_mode" in self.node_meta)
+        depth = max((self._depth(n) for n in self.node_meta if n != "_delim_mode"), default=0)
+        return (
+            f"{self.lines} lines inserted, {nodes} nodes, {len(self.edges)} edges, "
+            f"depth {depth}, ~{self.bytes / 2**20:.1f} MB"
+        )
+
+    def _over_budget(self) -> None:
+        """
+        The node store passed max_bytes: abort, or cap the depth so the
+        remaining nodes take at most half the budget.
+        """
+        if self.on_limit == "abort" or self.max_depth == 1:
+            raise MemoryBudgetError(self.stats())
+
+        # Estimated bytes per depth
+        cost: Dict[int, int] = {}
+        for name in self.node_meta:
+            if name != "_delim_mode":
+                d = self._depth(name)
+                cost[d] = cost.get(d, 0) + self.node_cost + len(name)
+
+        depth, total = 1, 0
+        for d in sorted(cost):
+            total += cost[d]
+            if total > self.max_bytes // 2 or (self.max_depth and d >= self.max_depth):
+                break
+            depth = d
+
+        self._prune(max(1, min(depth, (self.max_depth or depth + 1) - 1)))
+
+        if self.bytes > self.max_bytes:
+            raise MemoryBudgetError(self.stats())
+
+    def _prune(self, depth: int) -> None:
+        node_meta = self.node_meta
+        removed = [n for n in node_meta if n != "_delim_mode" and self._depth(n) > depth]
+
+        # Keys below each new cut-off node. Token nodes all look alike, so
+        # there only leaves are counted as keys.
+        if self.delim:
+            parents = {p for p, _ in self.edges}
+
+            def is_key(name, meta):
+                return name not in parents
+        else:
+            def is_key(name, meta):
+                return meta[0] != "point"
+
+        cut_keys: Dict[str, int] = {}
+        for name in removed:
+            meta = node_meta.pop(name)
+            keys = self.summary.pop(name)[0] if meta[0] == "summary" else int(is_key(name, meta))
+            if keys:
+                cut = self._ancestor(name, depth)
+                cut_keys[cut] = cut_keys.get(cut, 0) + keys
+            if self.delim:
+                self.node_status.pop(name, None)
+                self.key_status.pop(name, None)
+
+        self.edges = {(p, c) for p, c in self.edges if c in node_meta}
+
+        if self.on_limit == "summary":
+            for cut, keys in sorted(cut_keys.items()):
+                meta = node_meta[cut]
+                text = meta[1] or (cut.rsplit(self.delim, 1)[-1] if self.delim else cut)
+                if cut in self.summary:
+                    text = self.summary[cut][1]
+                self._summarize(cut, text, keys)
+
+        self.max_depth = depth
+        self.bytes = sum(self.node_cost + len(n) for n in node_meta if n != "_delim_mode")
+
+        sys.stderr.write(
+            f"tries.py: warning: --max-memory reached, pruned the trie to depth {depth} "
+            f"({len(removed)} nodes removed, {self.on_limit} mode)\n"
+        )
+
+def mark_options(args):
+    """
+    Return (mark_patterns, mark_is_default) for the parsed -M option.
+    """
+    # Fix: If user passes -M '' (empty string), treat as "match nothing"
+    if args.mark == [""]:
+        patterns = []
+    else:
+        patterns = args.mark
+    return patterns, patterns == DEFAULT_MARK_PATTERNS
+
+def new_builder(args) -> TrieBuilder:
+    """
+    Create a TrieBuilder from parsed options.
+    """
+    mark_patterns, mark_is_default = mark_options(args)
+
+    builder = TrieBuilder(
+        mark_patterns=mark_patterns,
+        mark_is_default=mark_is_default,
+        # Head-mode is only meaningful in character-mode
+        head_mode=args.head and not args.delim,
+        keep_prefix=args.keep_prefix,
+        keep_fqdn=args.keep_fqdn,
+        ignore_case=args.ignore_case,
+        no_labels=args.no_labels,
+        delim=args.delim,
+        rtl=args.rtl,
+        max_bytes=args.max_memory,
+        on_limit=args.on_memory_limit,
+        normalize=args.normalize,
+        diff=bool(args.diff),
+    )
+    if args.meta:
+        builder.meta = load_meta(args.meta, args.meta_key, args.meta_style, builder.key)
+    if args._records and args._records.flagged:
+        builder.flagged = {name for name in map(builder.key, args._records.flagged) if name}
+    return builder
+
+def key_diff_status(builder, lines, diff_status) -> Dict[str, str]:
+    """
+    Re-tag --diff lines by the key they end at. Lines from both inputs
+    that reduce to one key (FQDN stripping, --ignore-case, --normalize)
+    are unchanged, whatever their raw text.
+    """
+    keys = [builder.key(line) for line in lines]
+    by_key: Dict[str, Optional[str]] = {}
+    for line, key in zip(lines, keys):
+        if key is not None:
+            status = diff_status.get(line)
+            by_key[key] = status if by_key.get(key, status) == status else None
+    return {line: by_key[key] for line, key in zip(lines, keys) if key is not None and by_key[key]}
+
+def insert_lines(builder, lines, diff_status, diff_only=False, progress=None, engine="python") -> None:
+    if diff_status:
+        diff_status = key_diff_status(builder, lines, diff_status)
+
+    np = bulk_engine(builder, engine, len(lines)) if engine != "python" else None
+    if np is not None:
+        bulk_insert_chars(builder, lines, diff_status, diff_only, lambda keys: lcp_numpy(keys, np))
+        if progress:
+            progress.finish("building", building_status(builder, len(lines), progress))
+        return
+
+    try:
+        for i, line in enumerate(lines):
+            status = diff_status.get(line)
+            if diff_only and status is None:
+                continue
+            builder.insert(line, status)
+
+            if progress and not i & 4095 and progress.due():
+                progress.show("building", building_status(builder, i, progress) + progress.eta(i, len(lines)))
+    except MemoryBudgetError as exc:
+        sys.exit(memory_error(exc, f"of {len(lines)} "))
+
+    if diff_only and builder.delim:
+        for line in lines:
+            if diff_status.get(line) is None:
+                builder.share(line)
+
+    if progress:
+        progress.finish("building", building_status(builder, len(lines), progress))
+
+def building_status(builder, done, progress) -> str:
+    nodes = len(builder.node_meta) - ("_delim_mode" in builder.node_meta)
+    rate = done / max(progress.elapsed(), 1e-9)
+    return f"{done:,} lines ({rate:,.0f}/s), {nodes:,} nodes, ~{builder.bytes / 2**20:,.0f} MB"
+
+def memory_error(exc, total: str = "") -> str:
+    return (
+        f"tries.py: error: --max-memory reached: {str(exc).replace(' lines', ' ' + total + 'lines', 1)}\n"
+        "Raise --max-memory, use --on-memory-limit prune|summary, or narrow the input with -f."
+    )
+
+def memory_size(value: str) -> int:
+    """
+    argparse type for --max-memory: a number of MB, or a K/M/G/T suffix.
+    """
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?", value.strip(), re.IGNORECASE)
+    if not m:
+        raise argparse.ArgumentTypeError(f"invalid size '{value}' (e.g. 512M, 2G)")
+    unit = m.group(2).upper() or "M"
+    return int(float(m.group(1)) * 1024 ** "KMGT".index(unit) * 1024)
 
 # ---------------------------------------------------------------------------
-# DOT output
+# Metadata join (--meta)
 # ---------------------------------------------------------------------------
 
-def to_dot(
+def meta_style(value: str) -> Tuple[str, str]:
+    """
+    argparse type for --meta-style COLUMN=ATTRIBUTE.
+    """
+    column, sep, attr = value.partition("=")
+    if not sep or not column or not re.fullmatch(r"[A-Za-z_]\w*", attr):
+        raise argparse.ArgumentTypeError(f"expected COLUMN=ATTRIBUTE, got '{value}'")
+    if attr == "label":
+        raise argparse.ArgumentTypeError("labels come from the input; use xlabel or tooltip instead")
+    return column, attr
+
+def load_meta(path: str, key_column: Optional[str], styles, key) -> Dict[str, Dict[str, str]]:
+    """
+    Read a CSV with a header row into a hash index from node ID to DOT
+    attributes.
+
+    Keys are normalised with `key` (TrieBuilder.key), so a row joins the
+    line it names however the line is written. Rows with the same values
+    share one attribute dict, which keeps large inventories with few
+    distinct owners or environments small. Later rows win.
+    """
+    try:
+        fp = open(path, newline="", encoding="utf-8-sig")
+    except OSError as exc:
+        sys.exit(f"tries.py: error: --meta: {exc}")
+
+    with fp:
+        reader = csv.reader(fp)
+        header = next(reader, [])
+
+        def column(name):
+            if name not in header:
+                sys.exit(f"tries.py: error: --meta: no column '{name}' in {path} (columns: {', '.join(header)})")
+            return header.index(name)
+
+        key_at = column(key_column or (header[0] if header else ""))
+        attrs = [(column(c), a) for c, a in styles]
+        width = max([key_at] + [i for i, _ in attrs]) + 1
+
+        index: Dict[str, Dict[str, str]] = {}
+        shared: Dict[Tuple, Dict[str, str]] = {}
+        for row in reader:
+            if len(row) < width:
+                row += [""] * (width - len(row))
+            name = key(row[key_at])
+            if name is None:
+                continue
+            values = tuple((a, row[i].strip()) for i, a in attrs if row[i].strip())
+            if not values:
+                continue
+            found = shared.get(values)
+            if found is None:
+                found = shared[values] = dict(values)
+            index[name] = found
+
+    return index
+
+# ---------------------------------------------------------------------------
+# Bulk construction from sorted keys (--engine)
+# ---------------------------------------------------------------------------
+
+ENGINES = ["python", "numpy", "auto"]
+
+# Below this many lines the incremental builder is as fast as the bulk path
+BULK_MIN_LINES = 20000
+
+# Keys compared per NumPy block; a block is block x longest-key codes
+LCP_BLOCK = 65536
+
+def load_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def bulk_engine(builder, engine: str, count: int):
+    """
+    Return the numpy module if the bulk engine can build this trie, or
+    None to use TrieBuilder.insert(). --engine numpy explains why not.
+    """
+    reason = None
+    if builder.delim:
+        reason = "token mode (-D) uses the incremental builder"
+    elif builder.max_bytes:
+        reason = "--max-memory needs the incremental builder"
+    elif builder.node_meta:
+        reason = "the trie is not empty"
+    elif engine == "auto" and count < BULK_MIN_LINES:
+        return None
+
+    np = None if reason else load_numpy()
+    if np is None and reason is None:
+        reason = "NumPy is not installed"
+
+    if reason:
+        if engine == "numpy":
+            sys.stderr.write(f"tries.py: warning: --engine numpy: {reason}; using the Python builder\n")
+        return None
+    return np
+
+def lcp_numpy(keys: List[str], np) -> List[int]:
+    """
+    Longest common prefix of each key with the previous one (0 for the
+    first), compared as fixed-width uint8 (ASCII) or uint32 code arrays.
+    """
+    lcp = np.zeros(len(keys), dtype=np.int64)
+
+    for start in range(1, len(keys), LCP_BLOCK):
+        # Each block overlaps the previous one by a key
+        block = keys[start - 1:start + LCP_BLOCK]
+        lengths = np.fromiter(map(len, block), dtype=np.int64, count=len(block))
+        width = int(lengths.max())
+        text = "".join(k.ljust(width, "\0") for k in block)
+
+        if text.isascii():
+            codes = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+        else:
+            codes = np.frombuffer(text.encode("utf-32-le", errors="surrogatepass"), dtype="<u4")
+        codes = codes.reshape(len(block), width)
+
+        differ = codes[1:] != codes[:-1]
+        first = np.where(differ.any(axis=1), differ.argmax(axis=1), width)
+        # Padding can match a real NUL, so never run past the shorter key
+        lcp[start:start + len(block) - 1] = np.minimum(first, np.minimum(lengths[1:], lengths[:-1]))
+
+    return lcp.tolist()
+
+def bulk_insert_chars(builder, lines, diff_status, diff_only, lcp_lengths) -> None:
+    """
+    Build a character-mode trie from all lines at once.
+
+    Keys are normalised and deduplicated exactly as insert() would (the
+    last line for a key sets its label and style), then sorted. Key i
+    only adds the prefixes longer than its common prefix with key i-1,
+    so node and edge creation needs no per-character lookups; with the
+    LCP lengths computed in bulk the result equals the incremental build.
+    """
+    terminals: Dict[str, Tuple] = {}
+    for line in lines:
+        status = diff_status.get(line)
+        if diff_only and status is None:
+            continue
+        raw = line.strip()
+        if not raw:
+            continue
+        builder.lines += 1
+        base = builder.hostname(raw)
+        if not base:
+            continue
+        base_norm = base.lower() if builder.ignore_case else base
+        if builder.under is not None and builder._outside(base_norm):
+            continue
+        style = builder._style(base_norm in builder.flagged or builder.marked(base_norm), status)
+        terminals[base_norm] = (style, "" if builder.no_labels else base)
+        attrs = builder.meta.get(base_norm) if builder.meta else None
+        if attrs is not None:
+            terminals[base_norm] += (attrs,)
+
+    keys = sorted(terminals)
+    edges = builder.edges
+    node_meta = builder.node_meta
+
+    for key, common in zip(keys, lcp_lengths(keys)):
+        for size in range(common + 1, len(key) + 1):
+            name = key[:size]
+            if size == len(key):
+                node_meta[name] = terminals[key]
+            elif size > 1:
+                node_meta[name] = POINT
+            elif builder.head_mode:
+                node_meta[name] = ("head", "" if builder.no_labels else name)
+            else:
+                node_meta[name] = POINT
+            if size > 1:
+                edges.add((key[:size - 1], name))
+
+    builder.bytes = sum(builder.node_cost + len(n) for n in node_meta)
+
+# ---------------------------------------------------------------------------
+# Subtree selection (--root)
+# ---------------------------------------------------------------------------
+
+def root_key(prefix: str, delim: Optional[str], ignore_case: bool) -> str:
+    """
+    Convert a user-supplied --root prefix into the node ID used by TrieBuilder.
+    """
+    key = prefix.strip()
+    if ignore_case:
+        key = key.lower()
+    if delim:
+        key = delim.join(t for t in key.split(delim) if t)
+    return key
+
+def child_index(edges) -> Dict[str, List[str]]:
+    """
+    Map each parent node ID to its child node IDs.
+    """
+    children: Dict[str, List[str]] = {}
+    for p, c in edges:
+        children.setdefault(p, []).append(c)
+    return children
+
+def subtree(
     edges,
     nodes,
+    root: str,
     *,
-    rankdir,
-    edge_color,
-    point_color,
-    fontname,
+    delim: Optional[str] = None,
+    ancestors: bool = False,
+    children=None,
 ):
+    """
+    Return (edges, nodes) restricted to `root` and its descendants.
 
-    out = []
-    out.append("graph tries {")
-    out.append(f'  graph [fontname="{fontname}"];')
-    out.append(f'  node  [fontname="{fontname}"];')
-    out.append(f'  rankdir="{rankdir}";')
+    The walk starts at `root` and only visits its descendants, so once a
+    child index exists the cost depends on the subtree size alone. With
+    `ancestors`, the path from the head node down to `root` is kept too.
+    """
+    if root not in nodes:
+        return None
+
+    if children is None:
+        children = child_index(edges)
+
+    sub_edges = set()
+    sub_nodes = {}
+    if "_delim_mode" in nodes:
+        sub_nodes["_delim_mode"] = nodes["_delim_mode"]
+
+    stack = [root]
+    while stack:
+        name = stack.pop()
+        sub_nodes[name] = nodes[name]
+        for child in children.get(name, ()):
+            sub_edges.add((name, child))
+            stack.append(child)
+
+    if ancestors:
+        if delim:
+            tokens = root.split(delim)
+            path = [delim.join(tokens[:i]) for i in range(1, len(tokens) + 1)]
+        else:
+            path = [root[:i] for i in range(1, len(root) + 1)]
+
+        for p, c in zip(path, path[1:]):
+            sub_nodes[p] = nodes[p]
+            sub_edges.add((p, c))
+
+    return sub_edges, sub_nodes
+
+# ---------------------------------------------------------------------------
+# Minimised DAWG output (--dawg)
+# ---------------------------------------------------------------------------
+
+def dawg(edges, nodes, *, no_labels: bool = False):
+    """
+    Return (edges, nodes) with equivalent subtrees merged, turning the
+    trie into a minimal directed acyclic word graph.
+
+    Nodes are visited children first, in sorted order. A node's signature
+    is its style class, displayed text, extra attributes, whether it is a
+    head (heads have no incoming edge to share) and the representatives
+    of its children; the first node with a signature
+    stands in for every later one (the register of incremental DAWG
+    minimisation). Styles are part of the signature, so marked and diff
+    colors are never merged away.
+
+    A merged node ends many different names, so character-mode nodes
+    show their own character instead of the whole name (points through
+    an xlabel). Token-mode nodes already show their own token.
+    """
+    token_mode = "_delim_mode" in nodes
+    children = child_index(edges)
+    has_parent = {c for _, c in edges}
+    roots = sorted((n for n in nodes if n != "_delim_mode" and n not in has_parent), reverse=True)
+
+    out_edges = set()
+    out_nodes = {"_delim_mode": True} if token_mode else {}
+    register: Dict[Tuple, str] = {}
+    rep: Dict[str, str] = {}
+
+    stack = [(name, False) for name in roots]
+    while stack:
+        name, visited = stack.pop()
+        kids = children.get(name, ())
+        if not visited:
+            stack.append((name, True))
+            stack.extend((kid, False) for kid in sorted(kids, reverse=True))
+            continue
+
+        meta = nodes[name]
+        if not token_mode:
+            meta = char_meta(name, meta, no_labels)
+        extras = tuple(sorted(meta[2].items())) if len(meta) > 2 else ()
+        below = tuple(sorted({rep[kid] for kid in kids}))
+
+        key = (meta[0], meta[1], extras, name not in has_parent, below)
+        same = register.get(key)
+        if same is None:
+            same = register[key] = name
+            out_nodes[name] = meta
+            out_edges.update((name, kid) for kid in below)
+        rep[name] = same
+
+    return out_edges, out_nodes
+
+def char_meta(name: str, meta, no_labels: bool):
+    """
+    Relabel a character-mode node with its last character for dawg().
+    """
+    style, label = meta[0], meta[1]
+    if style in ("summary", "shard") or (label == "" and style != "point"):
+        return meta
+
+    text = label[-1] if label else name[-1]
+    if style != "point":
+        return (style, text) + meta[2:]
+    if no_labels:
+        return meta
+    # Extras go through attr_escape(), which leaves backslashes alone
+    return ("point", None, {"xlabel": text.replace("\\", "\\\\")})
+
+# ---------------------------------------------------------------------------
+# Trie shape and layout tuning (--large-graph)
+# ---------------------------------------------------------------------------
+
+def trie_shape(edges, nodes) -> Dict:
+    """
+    Measure a built trie: node/edge counts, depth, the widest rank, and
+    the per-depth and fan-out histograms behind them.
+
+    `compressible` counts unlabelled single-child nodes that path
+    compression would merge into their child (in token mode every node
+    is labelled, so all single-child nodes are counted).
+    """
+    children = child_index(edges)
+    names = [n for n in nodes if n != "_delim_mode"]
+    has_parent = {c for _, c in edges}
+    token_mode = "_delim_mode" in nodes
+
+    width: Dict[int, int] = {}
+    fanout: Dict[int, int] = {}
+    compressible = 0
+
+    level = sorted(n for n in names if n not in has_parent)
+    heads = len(level)
+    depth = 0
+    # A --dawg graph reaches shared nodes from several parents; count them once
+    seen = set(level)
+    while level:
+        depth += 1
+        width[depth] = len(level)
+        below = []
+        for name in level:
+            kids = children.get(name, ())
+            fanout[len(kids)] = fanout.get(len(kids), 0) + 1
+            if len(kids) == 1 and (token_mode or nodes[name][0] == "point"):
+                compressible += 1
+            below.extend(kid for kid in kids if kid not in seen)
+            seen.update(kids)
+        level = below
+
+    return {
+        "nodes": len(names),
+        "edges": len(edges),
+        "heads": heads,
+        "leaves": fanout.get(0, 0),
+        "terminals": None if token_mode else sum(nodes[n][0] not in ("point", "head") for n in names),
+        "unary": fanout.get(1, 0),
+        "compressible": compressible,
+        "depth": depth,
+        "width": max(width.values(), default=0),
+        "levels": width,
+        "fanout": fanout,
+    }
+
+# (minimum node count, graph attributes, relative cost) from cheapest to
+# most aggressive. Below the first tier the default header is unchanged.
+LAYOUT_TIERS = [
+    (2000, {
+        "newrank": "true",
+        "splines": "line",
+        "mclimit": "0.5",
+        "nslimit": "2",
+        "nslimit1": "2",
+    }, 0.3),
+    (20000, {
+        "newrank": "true",
+        "splines": "false",
+        "mclimit": "0.1",
+        "nslimit": "0.5",
+        "nslimit1": "0.5",
+        "remincross": "false",
+        "searchsize": "10",
+    }, 0.1),
+    (100000, {
+        "layout": "sfdp",
+        "splines": "false",
+        "overlap": "true",
+    }, None),
+]
+
+def layout_attrs(shape) -> Dict[str, str]:
+    """
+    Pick Graphviz graph attributes for a trie of this size.
+    """
+    attrs: Dict[str, str] = {}
+    for threshold, tier, _ in LAYOUT_TIERS:
+        if shape["nodes"] >= threshold:
+            attrs = tier
+    return dict(attrs)
+
+def layout_estimate(shape, attrs) -> float:
+    """
+    Rough layout time in seconds.
+
+    dot's ranking and crossing minimisation grow a little faster than
+    linearly; about V^1.5 scaled by the widest rank matches typical tries
+    well enough to tell seconds from hours. sfdp is close to V log V.
+    """
+    v = max(shape["nodes"], 1)
+
+    if attrs.get("layout") == "sfdp":
+        return 5e-6 * v * math.log2(v + 1)
+
+    seconds = 1e-5 * v ** 1.5 * max(1.0, math.log10(shape["width"] + 1))
+    for threshold, tier, factor in LAYOUT_TIERS:
+        if tier == attrs and factor:
+            seconds *= factor
+    return seconds
+
+def report_layout(shape, attrs) -> None:
+    engine = attrs.get("layout", "dot")
+    tuned = ", ".join(f"{k}={v}" for k, v in attrs.items()) or "defaults"
+    sys.stderr.write(
+        f"tries.py: layout estimate: {shape['nodes']} nodes, {shape['edges']} edges, "
+        f"depth {shape['depth']}, widest rank {shape['width']} -> "
+        f"~{layout_estimate(shape, attrs):.1f}s with {engine} ({tuned})\n"
+    )
+
+# ---------------------------------------------------------------------------
+# DOT output
+# ---------------------------------------------------------------------------
+
+def style_classes(palette) -> Dict[str, Dict[str, str]]:
+    """
+    Return the shared DOT attributes of each node style class for a
+    resolved theme palette. Classes are emitted in this order.
+    """
+    def filled(shape, fill, text):
+        attrs = {"shape": shape}
+        if fill:
+            attrs["style"] = "filled"
+            attrs["fillcolor"] = fill
+        if text:
+            attrs["fontcolor"] = text
+        return attrs
+
+    point = {"shape": "point"}
+    if palette["point"]:
+        point["color"] = palette["point"]
+
+    return {
+        "point": point,
+        "head": filled("circle", palette["head"], palette["text_head"]),
+        "normal": filled("Mrecord", palette["normal"], palette["text_normal"]),
+        "mark": filled("Mrecord", palette["mark"], palette["text_mark"]),
+        "added": filled("Mrecord", palette["added"], palette["text_normal"]),
+        "removed": filled("Mrecord", palette["removed"], palette["text_normal"]),
+        "summary": filled("note", palette["normal"], palette["text_normal"]),
+        "shard": filled("folder", palette["normal"], palette["text_normal"]),
+    }
+
+def dot_header(rankdir, edge_color, fontname, graph_attrs=None) -> List[str]:
+    out = []
+    out.append("graph tries {")
+    out.append(f'  graph [fontname="{fontname}"];')
+    out.append(f'  node  [fontname="{fontname}"];')
+    out.append(f'  rankdir="{rankdir}";')
+
+    for k, v in (graph_attrs or {}).items():
+        out.append(f'  {k}="{v}";')
+
+    if edge_color:
+        out.append(f'  edge [color="{edge_color}"];')
+    return out
+
+def attr_escape(value: str) -> str:
+    return str(value).replace('"', '\\"')
+
+def class_defaults(attrs: Dict[str, str]) -> str:
+    return ", ".join(f'{k}="{v}"' for k, v in attrs.items())
+
+def to_dot(
+    edges,
+    nodes,
+    *,
+    rankdir,
+    styles,
+    edge_color,
+    fontname,
+    graph_attrs=None,
+    short_ids=False,
+):
+    """
+    Nodes are grouped by style class; each class is a subgraph whose
+    `node [...]` defaults carry the shared attributes, so node lines only
+    hold the ID and label (plus any per-node extras such as shard URLs).
+
+    With `short_ids`, nodes are numbered n0, n1, ... in name order and the
+    prefix text only appears in labels, so edge lines no longer repeat
+    both full prefixes.
+    """
+    names = sorted(n for n in nodes if n != "_delim_mode")
+    if short_ids:
+        ids = {name: f"n{i}" for i, name in enumerate(names)}
+
+        def ref(name):
+            return ids[name]
+    else:
+        def ref(name):
+            return f'"{dot_escape(name)}"'
+
+    out = dot_header(rankdir, edge_color, fontname, graph_attrs)
+
+    delim_mode = nodes.get("_delim_mode", False)
+
+    # Node declarations, one subgraph per style class
+    classes: Dict[str, List[str]] = {name: [] for name in styles}
+    for name in names:
+        classes[nodes[name][0]].append(name)
+
+    for cls, members in classes.items():
+        if not members:
+            continue
+
+        out.append(f"  subgraph {cls} {{")
+        out.append(f"    node [{class_defaults(styles[cls])}];")
+
+        for name in members:
+            meta = nodes[name]
+            parts = []
+            if meta[1] is not None:
+                parts.append(f'label="{dot_escape(meta[1])}"')
+            if len(meta) > 2:
+                parts.extend(f'{k}="{attr_escape(v)}"' for k, v in meta[2].items())
+
+            attrs = f' [{", ".join(parts)}]' if parts else ""
+            out.append(f'    {ref(name)}{attrs};')
+
+        out.append("  }")
+
+    # ---------------------------------------------------------
+    # CHARACTER MODE ONLY: alphabetical single-character heads
+    # ---------------------------------------------------------
+    if not delim_mode:
+        heads = [n for n in names if len(n) == 1]
+        if heads:
+            out.append(
+                "  { rank = same; " +
+                "; ".join(ref(h) for h in heads) +
+                " }"
+            )
+            for a, b in zip(heads, heads[1:]):
+                out.append(f'  {ref(a)} -- {ref(b)} [style=invis];')
+
+    # Real edges
+    for p, c in sorted(edges):
+        out.append(f'  {ref(p)} -- {ref(c)};')
+
+    out.append("}")
+    return "\n".join(out)
+
+# ---------------------------------------------------------------------------
+# Interactive HTML viewer (--format html)
+# ---------------------------------------------------------------------------
+
+# Levels open when the page loads, and children listed per "more" click
+# below nodes with a large fan-out
+HTML_EXPAND_DEPTH = 2
+HTML_PAGE_CHILDREN = 200
+
+# Numbered X11 colors used by the shipped themes. Browsers only know the
+# base names (which mostly agree with X11), so these are translated.
+X11_COLORS = {
+    "azure2": "#e0eeee",
+    "cornsilk2": "#eee8cd",
+    "darkseagreen1": "#c1ffc1",
+    "darkseagreen2": "#b4eeb4",
+    "deepskyblue3": "#009acd",
+    "dodgerblue1": "#1e90ff",
+    "gold2": "#eec900",
+    "gold3": "#cdad00",
+    "honeydew2": "#e0eee0",
+    "ivory2": "#eeeee0",
+    "lemonchiffon1": "#fffacd",
+    "lightblue2": "#b2dfee",
+    "lightcyan2": "#d1eeee",
+    "lightgoldenrod1": "#ffec8b",
+    "lightgoldenrod2": "#eedc82",
+    "lightpink2": "#eea2ad",
+    "lightsalmon2": "#ee9572",
+    "lightskyblue2": "#a4d3ee",
+    "lightsteelblue1": "#cae1ff",
+    "lightsteelblue3": "#a2b5cd",
+    "lightyellow2": "#eeeed1",
+    "mistyrose1": "#ffe4e1",
+    "mistyrose2": "#eed5d2",
+    "palegreen2": "#90ee90",
+    "palegreen3": "#7ccd7c",
+    "paleturquoise2": "#aeeeee",
+    "plum1": "#ffbbff",
+    "seashell2": "#eee5de",
+    "skyblue1": "#87ceff",
+    "springgreen3": "#00cd66",
+    "steelblue1": "#63b8ff",
+    "thistle1": "#ffe1ff",
+}
+
+# Per-node attributes (shard links, --meta) the page applies to a node
+HTML_COLOR_ATTRS = ("fillcolor", "fontcolor", "color")
+
+# CSS standing in for the Graphviz node shapes
+HTML_SHAPES = {
+    "circle": "border-radius: 1em; min-width: 1em; text-align: center",
+    "Mrecord": "border-radius: .5em",
+    "note": "border-radius: 0 .6em 0 0",
+    "folder": "border-radius: .15em .6em .15em .15em",
+}
+
+def css_color(color: Optional[str]) -> Optional[str]:
+    """
+    Translate a Graphviz color name into one a browser understands.
+    """
+    if not color or color.startswith("#"):
+        return color
+
+    name = color.lower()
+    gray = re.fullmatch(r"gr[ae]y(\d{1,3})", name)
+    if gray:
+        return "#" + f"{round(int(gray.group(1)) * 255 / 100):02x}" * 3
+    return X11_COLORS.get(name) or re.sub(r"[1-4]$", "", name)
+
+def html_css(styles, edge_color, fontname) -> str:
+    rules = [
+        f"body {{ font-family: {fontname}, monospace; }}",
+        f"ul ul {{ border-left: 1px solid {css_color(edge_color) or 'gray'}; }}",
+    ]
+    for cls, attrs in styles.items():
+        if attrs["shape"] == "point":
+            rules.append(f".n-{cls}::before {{ color: {css_color(attrs.get('color')) or 'black'}; }}")
+            continue
+
+        decl = [HTML_SHAPES.get(attrs["shape"], "")]
+        if attrs.get("fillcolor"):
+            decl.append(f"background: {css_color(attrs['fillcolor'])}")
+        if attrs.get("fontcolor"):
+            decl.append(f"color: {css_color(attrs['fontcolor'])}")
+        rules.append(f".n-{cls} {{ {'; '.join(d for d in decl if d)}; }}")
+    return "\n".join(rules)
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>@TITLE@</title>
+<style>
+body { margin: 1em 2em; font-size: 14px; }
+header { color: #666; margin-bottom: 1em; }
+ul { list-style: none; margin: 0; padding-left: 1.4em; }
+body > ul { padding-left: 0; }
+li { margin: 2px 0; }
+.row { cursor: default; white-space: nowrap; }
+.row.open, .row.shut { cursor: pointer; }
+.row::before { display: inline-block; width: 1em; content: ""; color: #888; }
+.row.shut::before { content: "\\25b8"; }
+.row.open::before { content: "\\25be"; }
+.node { display: inline-block; padding: 0 .5em; border: 1px solid #0003; }
+.n-point { border: none; padding: 0; }
+.n-point::before { content: "\\2022\\00a0"; }
+.more { color: #666; cursor: pointer; font-style: italic; }
+@CSS@
+</style>
+</head>
+<body>
+<header>@SUMMARY@ &middot; click a node to expand it, shift-click to expand everything below</header>
+<ul id="trie"></ul>
+<script type="application/json" id="trie-data">@DATA@</script>
+<script>
+(function () {
+  var data = JSON.parse(document.getElementById("trie-data").textContent);
+  var seg = data.seg, cls = data.cls, count = data.count, labels = data.labels;
+  var extra = data.extra, classes = data.classes, join = data.delim || "";
+
+  // Breadth-first order: the children of each node are consecutive
+  var first = [], next = data.roots;
+  for (var i = 0; i < seg.length; i++) { first.push(next); next += count[i]; }
+
+  function named(prefix, i) {
+    return prefix === null ? seg[i] : prefix + join + seg[i];
+  }
+
+  // Collapse chains of unlabelled single-child nodes into one row
+  function row(i, prefix) {
+    var name = named(prefix, i), text = seg[i];
+    while (classes[cls[i]] === "point" && count[i] === 1) {
+      i = first[i];
+      name = named(name, i);
+      text += join + seg[i];
+    }
+    return { i: i, name: name, text: text };
+  }
+
+  function box(r) {
+    var i = r.i, c = classes[cls[i]], x = extra[i] || {};
+    var el = document.createElement(x.URL ? "a" : "span");
+    el.className = "node n-" + c;
+    el.title = x.tooltip || r.name;
+    if (x.URL) el.href = x.URL;
+    if (x.fillcolor) el.style.background = x.fillcolor;
+    if (x.fontcolor) el.style.color = x.fontcolor;
+    if (x.color) el.style.borderColor = x.color;
+    if (c === "point") el.textContent = r.text;
+    else if (i in labels) el.textContent = labels[i];
+    else el.textContent = data.delim === null ? r.name : seg[i];
+    return el;
+  }
+
+  function fill(list, r, start, depth) {
+    var end = Math.min(count[r.i], start + data.page);
+    for (var k = start; k < end; k++) list.appendChild(item(first[r.i] + k, r.name, depth));
+    if (end < count[r.i]) {
+      var more = list.appendChild(document.createElement("li"));
+      more.className = "more";
+      more.textContent = "\\u2026 " + (count[r.i] - end) + " more";
+      more.onclick = function () { list.removeChild(more); fill(list, r, end, depth); };
+    }
+  }
+
+  function item(i, prefix, depth) {
+    var r = row(i, prefix), li = document.createElement("li");
+    var line = li.appendChild(document.createElement("div")), list = null;
+    line.className = "row";
+    line.appendChild(box(r));
+    if (!count[r.i]) return li;
+
+    function open(levels) {
+      if (!list) {
+        list = li.appendChild(document.createElement("ul"));
+        fill(list, r, 0, levels - 1);
+      }
+      list.hidden = false;
+      line.className = "row open";
+    }
+    line.onclick = function (ev) {
+      if (ev.target.href) return;
+      if (ev.shiftKey) {
+        if (list) { li.removeChild(list); list = null; }
+        open(Infinity);
+      } else if (list && !list.hidden) {
+        list.hidden = true;
+        line.className = "row shut";
+      } else {
+        open(1);
+      }
+    };
+    line.className = "row shut";
+    if (depth > 0) open(depth);
+    return li;
+  }
+
+  var top = document.getElementById("trie");
+  for (var k = 0; k < data.roots; k++) top.appendChild(item(k, null, data.expand - 1));
+})();
+</script>
+</body>
+</html>
+"""
+
+def to_html(
+    edges,
+    nodes,
+    *,
+    delim,
+    styles,
+    edge_color,
+    fontname,
+    expand=HTML_EXPAND_DEPTH,
+):
+    """
+    Return a self-contained HTML page that browses the trie as a
+    collapsible tree.
+
+    Nothing is laid out up front: the trie is embedded as compact JSON
+    (each node's segment, class and child count, in breadth-first order so
+    children are consecutive) and the page only builds the rows of the
+    branches that are opened, starting with the top `expand` levels.
+    Unlabelled single-child chains are shown as one row, and large
+    fan-outs are listed a page at a time.
+    """
+    kids = child_index(edges)
+    children = {c for _, c in edges}
+    class_ids = {c: n for n, c in enumerate(styles)}
+    skip = len(delim) if delim else 0
+
+    # (name, offset of its segment) in breadth-first order
+    order = [(n, 0) for n in sorted(nodes) if n != "_delim_mode" and n not in children]
+    roots = len(order)
+
+    seg, cls, count, labels, extra = [], [], [], {}, {}
+    for i, (name, start) in enumerate(order):
+        below = sorted(kids.get(name, ()))
+        order.extend((child, len(name) + skip) for child in below)
+
+        meta = nodes[name]
+        seg.append(name[start:])
+        cls.append(class_ids[meta[0]])
+        count.append(len(below))
+
+        # Labels are only stored where the page cannot derive them
+        if meta[0] == "point":
+            default = None
+        else:
+            default = name[start:] if delim else name
+        if meta[1] != default:
+            labels[i] = meta[1]
+        if len(meta) > 2:
+            extra[i] = {k: css_color(v) if k in HTML_COLOR_ATTRS else v for k, v in meta[2].items()}
+
+    data = {
+        "delim": delim,
+        "classes": list(styles),
+        "roots": roots,
+        "expand": expand,
+        "page": HTML_PAGE_CHILDREN,
+        "seg": seg,
+        "cls": cls,
+        "count": count,
+        "labels": labels,
+        "extra": extra,
+    }
+    # "<" is escaped so no segment can close the <script> element early
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).replace("<", "\\u003c")
+
+    summary = f"{len(seg):,} nodes, {len(edges):,} edges"
+    return (
+        HTML_TEMPLATE
+        .replace("@TITLE@", "tries")
+        .replace("@SUMMARY@", summary)
+        .replace("@CSS@", html_css(styles, edge_color, fontname))
+        .replace("@DATA@", payload)
+    )
+
+# ---------------------------------------------------------------------------
+# Output rendering and writing
+# ---------------------------------------------------------------------------
+
+OUTPUT_FORMATS = ["dot", "html", "png", "svg", "pdf"]
+
+# Formats written as text by graph_dot() itself; the rest go through Graphviz
+TEXT_FORMATS = ("dot", "html")
+
+def render(dot: str, fmt: str) -> bytes:
+    """
+    Return DOT (or HTML) text as bytes, or run Graphviz to render it into `fmt`.
+    """
+    if fmt in TEXT_FORMATS:
+        return dot.encode("utf-8")
+
+    try:
+        proc = subprocess.run(
+            ["dot", f"-T{fmt}"],
+            input=dot.encode("utf-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+    except FileNotFoundError:
+        sys.exit(f"tries.py: error: Graphviz 'dot' is required for --format {fmt}")
+    except subprocess.CalledProcessError as e:
+        err = e.stderr.decode("utf-8", errors="replace").strip()
+        sys.exit(f"tries.py: error: dot -T{fmt} failed: {err}")
+
+    return proc.stdout
+
+# os.umask() can only be read by setting it, so do that once at startup
+# rather than from worker threads
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+@contextlib.contextmanager
+def atomic_file(path):
+    """
+    Yield a binary file that is written next to `path` and renamed into
+    place on success, so readers never see a half-written file.
+    """
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        # mkstemp() creates the file 0600; give it the usual new-file mode
+        os.fchmod(fd, 0o666 & ~UMASK)
+        with os.fdopen(fd, "wb") as fp:
+            yield fp
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+def write_atomic(path, data: bytes) -> None:
+    with atomic_file(path) as fp:
+        fp.write(data)
+
+def write_data(data: bytes, path: Optional[str]) -> None:
+    """
+    Write rendered output to `path` (atomically), or to stdout.
+    """
+    if path:
+        write_atomic(path, data)
+        return
+
+    buffer = getattr(sys.stdout, "buffer", None)
+    if buffer is None:
+        sys.stdout.write(data.decode("utf-8"))
+        return
+    sys.stdout.flush()
+    buffer.write(data)
+    buffer.flush()
+
+def write_output(dot: str, path: Optional[str], fmt: str) -> None:
+    if not path and fmt in TEXT_FORMATS:
+        sys.stdout.write(dot)
+    else:
+        write_data(render(dot, fmt), path)
+
+def select_root(args, edges, node_meta):
+    """
+    Apply --root; return (edges, node_meta), or None if the root is missing.
+    """
+    if not args.root:
+        return edges, node_meta
+
+    key = root_key(args.root, args.delim, args.ignore_case)
+    selected = subtree(
+        edges,
+        node_meta,
+        key,
+        delim=args.delim,
+        ancestors=args.root_ancestors,
+    )
+    if selected is not None:
+        dbg(args.debug, f"Subtree at '{key}': {len(selected[1])} nodes")
+    return selected
+
+def build_dot(args, edges, node_meta, palette) -> Optional[str]:
+    """
+    Apply --root and return the DOT text, or None if the root is missing.
+    """
+    selected = select_root(args, edges, node_meta)
+    if selected is None:
+        return None
+    return graph_dot(args, *selected, palette)
+
+def graph_dot(args, edges, node_meta, palette) -> str:
+    """
+    Return the DOT text for a trie, or the viewer page with --format html.
+    """
+    if args.dawg:
+        edges, node_meta = dawg(edges, node_meta, no_labels=args.no_labels)
+
+    dbg(args.debug, f"Final edge count: {len(edges)}")
+    dbg(args.debug, f"Final node count: {len(node_meta)}")
+
+    if args.format == "html":
+        return to_html(
+            edges,
+            node_meta,
+            delim=args.delim,
+            styles=style_classes(palette),
+            edge_color=palette["edge"],
+            fontname=FONT_MAP[args.font],
+        )
+
+    graph_attrs = None
+    if args.large_graph:
+        shape = trie_shape(edges, node_meta)
+        graph_attrs = layout_attrs(shape)
+        report_layout(shape, graph_attrs)
+
+    return to_dot(
+        edges,
+        node_meta,
+        rankdir=args.dir,
+        styles=style_classes(palette),
+        edge_color=palette["edge"],
+        fontname=FONT_MAP[args.font],
+        graph_attrs=graph_attrs,
+        short_ids=args.short_ids,
+    )
+
+# ---------------------------------------------------------------------------
+# Presorted streaming build (--assume-sorted)
+# ---------------------------------------------------------------------------
+
+# Options that need the whole trie in memory before anything is written
+SORTED_CONFLICTS = (
+    "diff", "watch", "batch", "freeze", "plan", "split_by", "root", "large_graph", "dawg", "mark_field",
+)
+
+# Nodes buffered before they are written out as one subgraph per class
+SORTED_CHUNK_NODES = 4096
+
+class UnsortedInputError(ValueError):
+    """
+    Raised by SortedTrieWriter when a key falls below a node it has
+    already written and closed.
+    """
+
+class SortedTrieWriter:
+    """
+    Write DOT for sorted input in one pass, without building a trie.
+
+    The writer keeps the nodes a later key may still reach open and writes
+    every other node as soon as it is closed, followed by the edges to its
+    children once it closes itself. Each depth holds a short chain of open
+    siblings: the node on the previous key's path, plus any siblings that
+    are a string prefix of it. Byte-sorted input needs those: `sort` puts
+    "/usr/lib", "/usr/lib.d/x", "/usr/lib/y" in that order, because "."
+    sorts before "/", so "lib" has to stay open while "lib.d" is written.
+    A key may also end on an open node ("acmefw01" after "acmefw01-oob"),
+    which then becomes a terminal before it is written.
+
+    Any order works as long as it never reopens a closed node, which plain
+    `LC_ALL=C sort` of the raw lines meets for hostnames, FQDNs and paths.
+    Open nodes remember which children they have closed, so a key that
+    would reopen one is reported instead. Working memory is the open path
+    plus those children, not the whole input. Node and edge lines are
+    buffered in chunks of SORTED_CHUNK_NODES so each chunk can still be
+    written as one subgraph per style class, followed by its edges.
+
+    Repeated keys (e.g. "ACME" and "acme" with --ignore-case) are merged.
+    In character mode the last line's label and style win, as they do in
+    TrieBuilder; in token mode nodes keep the style of the line that
+    created them.
+    """
+
+    def __init__(self, write, builder: TrieBuilder, *, styles, short_ids: bool = False):
+        self.write = write
+        self.builder = builder
+        self.styles = styles
+        self.short_ids = short_ids
+        self.delim = builder.delim
+
+        # Open sibling chains per depth; the last node of each chain is on
+        # the previous key's path. Nodes are lists of
+        # [name, segment, ref, meta, closed child segments, child refs].
+        self.levels: List[List[list]] = []
+        self.closed_heads = set()
+        self.heads: List[Tuple[str, str]] = []
+        self.chunk: Dict[str, List[str]] = {}
+        self.chunk_edges: List[str] = []
+        self.chunk_nodes = 0
+
+        self.lines = 0
+        self.nodes = 0
+
+    def add(self, raw: str) -> None:
+        """
+        Add the nodes of one input line. Blank lines are ignored.
+        """
+        raw = raw.strip()
+        if not raw:
+            return
+
+        b = self.builder
+        if self.delim:
+            if b.normalize:
+                raw = b.normalize(raw)
+            labels = [t for t in raw.split(self.delim) if t]
+            if not labels:
+                return
+            if b.rtl:
+                labels.reverse()
+            key = tuple(t.lower() for t in labels) if b.ignore_case else tuple(labels)
+            style = b._style(b.marked(raw), None)
+        else:
+            labels = b.hostname(raw)
+            if not labels:
+                return
+            key = labels.lower() if b.ignore_case else labels
+            style = b._style(b.marked(key), None)
+        self.lines += 1
+
+        # Follow the previous key's path as far as the new key shares it
+        levels = self.levels
+        common = 0
+        limit = min(len(levels), len(key))
+        while common < limit and levels[common][-1][1] == key[common]:
+            common += 1
+
+        if common < len(key):
+            self._close_below(common + 1)
+            if common < len(levels):
+                # Keep the siblings the new segment extends; one may be it
+                chain = levels[common]
+                parent = levels[common - 1][-1] if common else None
+                seg = key[common]
+                while chain and not seg.startswith(chain[-1][1]):
+                    self._close(chain.pop(), parent)
+                if not chain:
+                    levels.pop()
+                elif chain[-1][1] == seg:
+                    common += 1
+        else:
+            self._close_below(common)
+
+        if common == len(key):
+            # Ends on a node that is still open
+            node = levels[common - 1][-1]
+            if not self.delim:
+                node[3] = self._terminal(key, style, labels)
+            elif b.meta:
+                node[3] = self._terminal(node[0], node[3][0], node[3][1])
+            return
+
+        closed = levels[common - 1][-1][4] if common else self.closed_heads
+        if key[common] in closed:
+            name = levels[common - 1][-1][0] + (self.delim or "") + key[common] if common else key[common]
+            raise UnsortedInputError(
+                f"'{raw}' (key {self.lines:,}) falls under '{name}', which was already written"
+            )
+
+        last = len(key) - 1
+        for depth in range(common, len(key)):
+            if depth:
+                name = levels[depth - 1][-1][0] + (self.delim or "") + key[depth]
+            else:
+                name = key[0]
+
+            if self.delim:
+                if depth == last:
+                    meta = self._terminal(name, style, labels[depth])
+                else:
+                    meta = (style, "" if b.no_labels else labels[depth])
+            elif depth == last:
+                meta = self._terminal(key, style, labels)
+            elif depth == 0 and b.head_mode:
+                meta = ("head", "" if b.no_labels else name)
+            else:
+                meta = POINT
+
+            node = [name, key[depth], self._ref(name), meta, set(), []]
+            if depth < len(levels):
+                levels[depth].append(node)
+            else:
+                levels.append([node])
+
+    def close(self) -> None:
+        """
+        Write the remaining nodes and close the graph.
+        """
+        self._close_below(0)
+
+        # Character-mode heads sit on one rank in alphabetical order
+        heads = [ref for _, ref in sorted(self.heads)]
+        for a, c in zip(heads, heads[1:]):
+            self.chunk_edges.append(f"  {a} -- {c} [style=invis];\n")
+        self._write_chunk()
+        if heads:
+            self.write("  { rank = same; " + "; ".join(heads) + " }\n")
+        self.write("}")
+
+    def _close_below(self, depth: int) -> None:
+        """
+        Close every open node at `depth` and deeper, deepest first.
+        """
+        levels = self.levels
+        while len(levels) > depth:
+            chain = levels[-1]
+            parent = levels[-2][-1] if len(levels) > 1 else None
+            while chain:
+                self._close(chain.pop(), parent)
+            levels.pop()
+
+    def _terminal(self, name: str, style: str, label: str):
+        meta = (style, "" if self.builder.no_labels else label)
+        attrs = self.builder.meta.get(name) if self.builder.meta else None
+        return meta if attrs is None else meta + (attrs,)
+
+    def _ref(self, name: str) -> str:
+        self.nodes += 1
+        if self.short_ids:
+            return f"n{self.nodes - 1}"
+        return f'"{dot_escape(name)}"'
+
+    def _close(self, node, parent) -> None:
+        """
+        Write a node that no later key can reach, and the edges to its
+        children (written before it, so every edge follows both ends).
+        """
+        name, segment, ref, meta, _, children = node
+        parts = []
+        if meta[1] is not None:
+            parts.append(f'label="{dot_escape(meta[1])}"')
+        if len(meta) > 2:
+            parts.extend(f'{k}="{attr_escape(v)}"' for k, v in meta[2].items())
+        attrs = f' [{", ".join(parts)}]' if parts else ""
+        self.chunk.setdefault(meta[0], []).append(f"    {ref}{attrs};\n")
+        self.chunk_edges.extend(f"  {ref} -- {child};\n" for child in children)
+
+        if parent:
+            parent[4].add(segment)
+            parent[5].append(ref)
+        else:
+            self.closed_heads.add(segment)
+            if not self.delim:
+                self.heads.append((name, ref))
+
+        self.chunk_nodes += 1
+        if self.chunk_nodes >= SORTED_CHUNK_NODES:
+            self._write_chunk()
+
+    def _write_chunk(self) -> None:
+        """
+        Write the buffered nodes, one subgraph per class, then their edges.
+        """
+        for cls in self.styles:
+            members = self.chunk.get(cls)
+            if members:
+                self.write(f"  subgraph {cls} {{\n    node [{class_defaults(self.styles[cls])}];\n")
+                self.write("".join(members))
+                self.write("  }\n")
+        self.write("".join(self.chunk_edges))
+        self.chunk = {}
+        self.chunk_edges = []
+        self.chunk_nodes = 0
+
+def run_sorted(args, palette, batches, size: Optional[int] = None) -> None:
+    """
+    Stream sorted input straight to DOT output (--assume-sorted).
+    """
+    accept = line_filter(args.filter, args.invert_filter)
+    progress = Progress(args.progress)
+    chars = 0
+
+    with contextlib.ExitStack() as stack:
+        if args.output:
+            fp = stack.enter_context(atomic_file(args.output))
+            out = stack.enter_context(io.TextIOWrapper(fp, encoding="utf-8", newline=""))
+        else:
+            out = sys.stdout
+
+        writer = SortedTrieWriter(
+            out.write,
+            new_builder(args),
+            styles=style_classes(palette),
+            short_ids=args.short_ids,
+        )
+        out.write("\n".join(dot_header(args.dir, palette["edge"], FONT_MAP[args.font])) + "\n")
+
+        try:
+            for batch in batches:
+                for line in batch:
+                    if accept(line):
+                        writer.add(line)
+
+                if size:
+                    chars += sum(map(len, batch)) + len(batch)
+                if progress.due():
+                    progress.show("streaming", streaming_status(writer, progress) + progress.eta(chars, size))
+        except UnsortedInputError as exc:
+            sys.exit(
+                f"tries.py: error: --assume-sorted: input is out of order: {exc}\n"
+                "Sort or group the input first (e.g. LC_ALL=C sort -u), or drop --assume-sorted."
+            )
+
+        writer.close()
+        progress.finish("streaming", streaming_status(writer, progress))
+
+    dbg(args.debug, f"Streamed {writer.lines} lines into {writer.nodes} nodes")
+
+def streaming_status(writer, progress) -> str:
+    rate = writer.lines / max(progress.elapsed(), 1e-9)
+    return f"{writer.lines:,} lines ({rate:,.0f}/s), {writer.nodes:,} nodes written"
+
+# ---------------------------------------------------------------------------
+# Dry-run planning (--plan)
+# ---------------------------------------------------------------------------
+
+def dot_size(edges, nodes, short_ids: bool = False) -> int:
+    """
+    Estimate the size in bytes of to_dot() output without building it.
+    Escaping is ignored, so names with quotes or braces count a little short.
+    """
+    names = sorted(n for n in nodes if n != "_delim_mode")
+    if short_ids:
+        width = {name: len(f"n{i}") for i, name in enumerate(names)}
+    else:
+        width = {name: len(name.encode("utf-8", errors="surrogateescape")) + 2 for name in names}
+
+    size = 150 + 130 * len({nodes[n][0] for n in names})
+    for name in names:
+        label = nodes[name][1]
+        size += 6 + width[name]
+        if label is not None:
+            size += 10 + len(label.encode("utf-8", errors="surrogateescape"))
+    for p, c in edges:
+        size += 8 + width[p] + width[c]
+    return size
+
+def histogram(counts: Dict, labels=None, bar: int = 40) -> List[str]:
+    top = max(counts.values(), default=0) or 1
+    rows = []
+    for key, count in counts.items():
+        label = labels(key) if labels else str(key)
+        rows.append(f"  {label:>7}  {count:>12,}  {'#' * max(1, round(bar * count / top)) if count else ''}")
+    return rows
+
+def fanout_buckets(fanout: Dict[int, int]) -> Dict[Tuple[int, int], int]:
+    """
+    Group fan-out counts as 0, 1, 2, 3-4, 5-8, ... (powers of two).
+    """
+    buckets: Dict[Tuple[int, int], int] = {}
+    for k in sorted(fanout):
+        if k <= 2:
+            bucket = (k, k)
+        else:
+            hi = 1 << (k - 1).bit_length()
+            bucket = (hi // 2 + 1, hi)
+        buckets[bucket] = buckets.get(bucket, 0) + fanout[k]
+    return buckets
+
+def plan_report(args, edges, node_meta, lines: Optional[int] = None, rooted: Optional[int] = None) -> str:
+    """
+    Describe the trie that would be drawn and what drawing it would cost.
+    `rooted` is the number of input lines that end below --root.
+    """
+    trie_nodes = len(node_meta) - ("_delim_mode" in node_meta)
+    if args.dawg:
+        edges, node_meta = dawg(edges, node_meta, no_labels=args.no_labels)
+
+    shape = trie_shape(edges, node_meta)
+    n = shape["nodes"]
+
+    def pct(part, whole):
+        return f"{100 * part / whole:.1f}%" if whole else "0.0%"
+
+    def mb(size):
+        if size < 2**20:
+            return f"{size / 1024:,.1f} KB"
+        return f"{size / 2**20:,.1f} MB"
+
+    dot_bytes = dot_size(edges, node_meta, args.short_ids)
+    short_bytes = dot_bytes if args.short_ids else dot_size(edges, node_meta, True)
+
+    tuned = layout_attrs(shape)
+    engine = tuned.get("layout", "dot")
+    settings = ", ".join(f"{k}={v}" for k, v in tuned.items())
+
+    out = ["Trie plan"]
+    if lines is not None and rooted is not None:
+        out.append(f"  input lines        {rooted:,} below --root ({lines:,} read)")
+    elif lines is not None:
+        out.append(f"  input lines        {lines:,}")
+    out.append(f"  nodes              {n:,}")
+    out.append(f"  edges              {shape['edges']:,}")
+    out.append(f"  head nodes         {shape['heads']:,}")
+    out.append(f"  leaves             {shape['leaves']:,}")
+    if shape["terminals"] is not None:
+        out.append(f"  terminals          {shape['terminals']:,}")
+    out.append(f"  depth              {shape['depth']:,} (widest rank {shape['width']:,})")
+    out.append(
+        f"  unary nodes        {shape['unary']:,} ({pct(shape['unary'], n)}); path compression "
+        f"would leave {n - shape['compressible']:,} nodes ({pct(shape['compressible'], n)} fewer)"
+    )
+    if args.dawg:
+        out.append(f"  suffix sharing     {trie_nodes:,} trie nodes merged into {n:,} ({pct(trie_nodes - n, trie_nodes)} fewer)")
+    out.append(
+        f"  DOT size           ~{mb(dot_bytes)}"
+        + ("" if args.short_ids else f" (~{mb(short_bytes)} with --short-ids)")
+    )
+    out.append(f"  layout (dot)       ~{clock(layout_estimate(shape, {}))} with default settings")
+    if tuned:
+        out.append(f"  layout (tuned)     ~{clock(layout_estimate(shape, tuned))} with --large-graph ({engine}: {settings})")
+
+    out.append("")
+    out.append("Depth histogram (nodes per depth)")
+    out.extend(histogram(shape["levels"]))
+
+    out.append("")
+    out.append("Fan-out histogram (nodes per child count)")
+    out.extend(histogram(
+        fanout_buckets(shape["fanout"]),
+        lambda b: str(b[0]) if b[0] == b[1] else f"{b[0]}-{b[1]}",
+    ))
+
+    return "\n".join(out) + "\n"
+
+def write_plan(args, builder, lines: List[str]) -> bool:
+    """
+    Apply --root and write the --plan report. Return False if the root is missing.
+    """
+    selected = select_root(args, builder.edges, builder.node_meta)
+    if selected is None:
+        return False
+
+    # Count the lines the report describes: those that end below --root
+    rooted = None
+    if args.root:
+        key = root_key(args.root, args.delim, args.ignore_case)
+        below = key + args.delim if args.delim else key
+        rooted = sum(1 for name in map(builder.key, lines) if name and (name == key or name.startswith(below)))
+
+    write_data(plan_report(args, *selected, len(lines), rooted).encode("utf-8"), args.output)
+    return True
+
+# ---------------------------------------------------------------------------
+# Splitting into shards (--split-by)
+# ---------------------------------------------------------------------------
+
+def split_depth(value: str) -> int:
+    """
+    argparse type for --split-by: 'head' is depth 1, or 'depth=N'.
+    """
+    if value == "head":
+        return 1
+    m = re.fullmatch(r"depth=(\d+)", value)
+    if not m or int(m.group(1)) < 1:
+        raise argparse.ArgumentTypeError(f"expected 'head' or 'depth=N' (N >= 1), got '{value}'")
+    return int(m.group(1))
+
+def split_trie(edges, nodes, depth: int):
+    """
+    Cut the trie at `depth` (1 = head nodes / first tokens).
+
+    Returns (index_edges, index_nodes, shards): the index keeps every node
+    down to `depth`, and each node at `depth` with children becomes a shard
+    root. shards is a list of (root, edges, nodes) in node order.
+    """
+    children = child_index(edges)
+    has_parent = {c for _, c in edges}
+
+    index_edges = set()
+    index_nodes = {}
+    if "_delim_mode" in nodes:
+        index_nodes["_delim_mode"] = nodes["_delim_mode"]
+
+    shards = []
+    level = sorted(n for n in nodes if n != "_delim_mode" and n not in has_parent)
+    for d in range(1, depth + 1):
+        below = []
+        for name in level:
+            index_nodes[name] = nodes[name]
+            if d < depth:
+                for child in sorted(children.get(name, ())):
+                    index_edges.add((name, child))
+                    below.append(child)
+            elif name in children:
+                sub_edges, sub_nodes = subtree(edges, nodes, name, children=children)
+                shards.append((name, sub_edges, sub_nodes))
+        level = below
+
+    return index_edges, index_nodes, shards
+
+def shard_filename(root: str, fmt: str, taken) -> str:
+    """
+    Return a file name for the shard rooted at `root`, numbered when it
+    clashes with a name in `taken`. Names are compared case-folded, so
+    'A' and 'a' shards do not overwrite each other on case-insensitive
+    filesystems.
+    """
+    stem = re.sub(r"[^A-Za-z0-9_-]+", "_", root).strip("_") or "shard"
+    name = f"{stem}.{fmt}"
+    n = 1
+    while name.casefold() in taken or name.casefold() == f"index.{fmt}".casefold():
+        n += 1
+        name = f"{stem}-{n}.{fmt}"
+    taken.add(name.casefold())
+    return name
+
+def write_split(args, edges, node_meta, palette) -> bool:
+    """
+    Write one DOT (or rendered) file per branch into the -o directory, plus
+    index.<format> linking to them. Shards are rendered in parallel.
+    Return False if --root is missing.
+    """
+    selected = select_root(args, edges, node_meta)
+    if selected is None:
+        return False
+
+    write_shards(args, *selected, palette)
+    return True
+
+def write_shards(args, edges, node_meta, palette) -> None:
+    index_edges, index_nodes, shards = split_trie(edges, node_meta, args.split_by)
+
+    outdir = Path(args.output)
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    taken = set()
+    jobs = []
+    for root, sub_edges, sub_nodes in shards:
+        filename = shard_filename(root, args.format, taken)
+        count = len(sub_nodes) - ("_delim_mode" in sub_nodes)
+
+        # Marked and diff nodes keep their class; plain ones become folders
+        meta = index_nodes[root]
+        style = "shard" if meta[0] in ("point", "normal") else meta[0]
+        extras = {**(meta[2] if len(meta) > 2 else {}), "URL": filename, "tooltip": f"{count} nodes"}
+        index_nodes[root] = (style, f"{root} ({count})", extras)
+
+        jobs.append((outdir / filename, sub_edges, sub_nodes))
+
+    dbg(args.debug, f"Split at depth {args.split_by}: {len(shards)} shards, {len(index_nodes)} index nodes")
+
+    def write_shard(path, sub_edges, sub_nodes):
+        dot = graph_dot(args, sub_edges, sub_nodes, palette)
+        write_output(dot, str(path), args.format)
+        return path
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(write_shard, *job) for job in jobs]
+        futures.append(pool.submit(write_shard, outdir / f"index.{args.format}", index_edges, index_nodes))
+        for future in futures:
+            dbg(args.debug, f"Wrote {future.result()}")
+
+# ---------------------------------------------------------------------------
+# Frozen tries (--freeze / --snapshot)
+# ---------------------------------------------------------------------------
+
+SNAPSHOT_MAGIC = b"TRIESNAP"
+SNAPSHOT_VERSION = 1
+
+# Style classes a built trie can contain, stored as one byte per node
+NODE_CLASSES = ("point", "head", "normal", "mark", "added", "removed", "summary")
+
+NO_PARENT = 0xFFFFFFFF
+
+# Label references that avoid storing the same text twice
+LABEL_NONE = 0xFFFFFFFF     # no label (point nodes)
+LABEL_SEGMENT = 0xFFFFFFFE  # the node's own segment (token mode)
+LABEL_NAME = 0xFFFFFFFD     # the full node ID (character mode)
+
+# (name, array typecode) in file order
+SNAPSHOT_SECTIONS = (
+    ("parent", "I"),
+    ("first", "I"),
+    ("seg", "I"),
+    ("label", "I"),
+    ("offsets", "I"),
+    ("cls", "B"),
+    ("strings", "B"),
+)
+
+class FrozenTrie:
+    """
+    Read-only trie stored in flat arrays, in level order.
+
+    Nodes are numbered breadth-first and each node's children are stored
+    contiguously, sorted by segment. This is the degree sequence of a LOUDS
+    encoding kept as prefix sums (first), so child ranges need no
+    rank/select. Per node i:
+
+      parent[i]    parent node, or NO_PARENT for head nodes
+      first[i]     children of i are first[i] .. first[i+1]-1
+      seg[i]       string index of the character or token leading to i
+      label[i]     string index of the label, or a LABEL_* reference
+      cls[i]       index into NODE_CLASSES
+
+    Strings are one UTF-8 blob addressed by offsets. Head nodes are
+    0 .. roots-1. load() maps a saved snapshot and uses the arrays in
+    place, so opening a large snapshot costs almost no memory.
+    """
+
+    def __init__(self, *, delim, ignore_case, roots, arrays, mapped=None):
+        self.delim = delim
+        self.ignore_case = ignore_case
+        self.roots = roots
+        self.parent = arrays["parent"]
+        self.first = arrays["first"]
+        self.seg = arrays["seg"]
+        self.label = arrays["label"]
+        self.offsets = arrays["offsets"]
+        self.cls = arrays["cls"]
+        self.strings = arrays["strings"]
+        self._mapped = mapped
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    @classmethod
+    def freeze(cls, edges, node_meta, *, delim, ignore_case) -> "FrozenTrie":
+        """
+        Convert a built trie (edges, node_meta) into array form.
+        """
+        children = child_index(edges)
+        has_parent = {c for _, c in edges}
+        sep = len(delim) if delim else 0
+
+        table: Dict[str, int] = {}
+        blob = bytearray()
+        offsets = array("I", [0])
+
+        def intern(text):
+            index = table.get(text)
+            if index is None:
+                index = table[text] = len(table)
+                blob.extend(text.encode("utf-8", errors="surrogateescape"))
+                offsets.append(len(blob))
+            return index
+
+        parent = array("I")
+        first = array("I")
+        seg = array("I")
+        label = array("I")
+        classes = array("B")
+        class_index = {name: i for i, name in enumerate(NODE_CLASSES)}
+
+        # (node ID, parent number, segment) in level order
+        level = sorted((n, NO_PARENT, n) for n in node_meta if n != "_delim_mode" and n not in has_parent)
+        roots = len(level)
+        count = roots
+
+        while level:
+            below = []
+            for name, up, segment in level:
+                style, text = node_meta[name][:2]
+                number = len(parent)
+
+                parent.append(up)
+                seg.append(intern(segment))
+                classes.append(class_index[style])
+                if text is None:
+                    label.append(LABEL_NONE)
+                elif delim and text == segment:
+                    label.append(LABEL_SEGMENT)
+                elif text == name:
+                    label.append(LABEL_NAME)
+                else:
+                    label.append(intern(text))
+
+                first.append(count)
+                kids = sorted((c[len(name) + sep:], c) for c in children.get(name, ()))
+                below.extend((c, number, k) for k, c in kids)
+                count += len(kids)
+            level = below
+        first.append(count)
+
+        arrays = {
+            "parent": parent,
+            "first": first,
+            "seg": seg,
+            "label": label,
+            "offsets": offsets,
+            "cls": classes,
+            "strings": bytes(blob),
+        }
+        return cls(delim=delim, ignore_case=ignore_case, roots=roots, arrays=arrays)
+
+    def save(self, path: str) -> None:
+        header = json.dumps({
+            "delim": self.delim,
+            "ignore_case": self.ignore_case,
+            "roots": self.roots,
+            "byteorder": sys.byteorder,
+            "counts": [len(getattr(self, name)) for name, _ in SNAPSHOT_SECTIONS],
+        }).encode("utf-8")
+
+        parts = [SNAPSHOT_MAGIC, struct.pack("<II", SNAPSHOT_VERSION, len(header)), header]
+        size = sum(map(len, parts))
+        for name, _ in SNAPSHOT_SECTIONS:
+            # Keep every section 4-byte aligned so load() can cast in place
+            parts.append(b"\0" * (-size % 4))
+            size += -size % 4
+            data = bytes(getattr(self, name))
+            parts.append(data)
+            size += len(data)
+
+        write_atomic(path, b"".join(parts))
+
+    @classmethod
+    def load(cls, path: str) -> "FrozenTrie":
+        with open(path, "rb") as fp:
+            try:
+                mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"{path}: empty file, not a tries snapshot")
+
+        view = memoryview(mapped)
+        pos = len(SNAPSHOT_MAGIC) + 8
+        if bytes(view[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path}: not a tries snapshot")
+        if len(mapped) < pos:
+            raise ValueError(f"{path}: truncated snapshot header")
+
+        version, length = struct.unpack("<II", view[len(SNAPSHOT_MAGIC):pos])
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"{path}: unsupported snapshot version {version}")
+        if pos + length > len(mapped):
+            raise ValueError(f"{path}: truncated snapshot header")
+        try:
+            header = json.loads(bytes(view[pos:pos + length]))
+            byteorder, counts, roots = header["byteorder"], header["counts"], header["roots"]
+            delim, ignore_case = header["delim"], header["ignore_case"]
+        except (ValueError, TypeError, KeyError):
+            raise ValueError(f"{path}: damaged snapshot header")
+        if byteorder != sys.byteorder:
+            raise ValueError(f"{path}: snapshot was written on a {byteorder}-endian machine")
+        pos += length
+
+        if (
+            not isinstance(counts, list)
+            or len(counts) != len(SNAPSHOT_SECTIONS)
+            or not all(isinstance(c, int) and c >= 0 for c in counts)
+        ):
+            raise ValueError(f"{path}: damaged snapshot header")
+
+        arrays = {}
+        for (name, code), count in zip(SNAPSHOT_SECTIONS, counts):
+            pos += -pos % 4
+            size = count * array(code).itemsize
+            if pos + size > len(mapped):
+                raise ValueError(f"{path}: truncated snapshot ({name} section ends past the end of the file)")
+            arrays[name] = view[pos:pos + size].cast(code)
+            pos += size
+
+        # The sections must describe one trie: a node count shared by the
+        # per-node arrays, child ranges and string offsets inside it
+        nodes = len(arrays["parent"])
+        offsets, first = arrays["offsets"], arrays["first"]
+        if (
+            any(len(arrays[name]) != nodes for name in ("seg", "label", "cls"))
+            or len(first) != nodes + 1
+            or first[-1] != nodes
+            or not isinstance(roots, int)
+            or not 0 <= roots <= nodes
+            or not offsets
+            or offsets[-1] != len(arrays["strings"])
+        ):
+            raise ValueError(f"{path}: damaged snapshot (section sizes do not match)")
+
+        return cls(
+            delim=delim,
+            ignore_case=ignore_case,
+            roots=roots,
+            arrays=arrays,
+            mapped=mapped,
+        )
+
+    def string(self, index: int) -> str:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return bytes(self.strings[start:end]).decode("utf-8", errors="surrogateescape")
+
+    def segment(self, node: int) -> str:
+        return self.string(self.seg[node])
+
+    def children(self, node: Optional[int] = None) -> range:
+        """
+        Child node numbers of `node`, or the head nodes for None.
+        """
+        if node is None:
+            return range(self.roots)
+        return range(self.first[node], self.first[node + 1])
+
+    def find(self, key: str) -> Optional[int]:
+        """
+        Return the node number for a node ID (see root_key()), or None.
+        Each level is a binary search over the sorted child range.
+        """
+        parts = key.split(self.delim) if self.delim else list(key)
+        node = None
+        for part in parts:
+            kids = self.children(node)
+            lo, hi = kids.start, kids.stop
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self.segment(mid) < part:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo == kids.stop or self.segment(lo) != part:
+                return None
+            node = lo
+        return node
+
+    def path(self, node: int) -> List[int]:
+        """
+        Node numbers from the head node down to `node`.
+        """
+        out = []
+        while node != NO_PARENT:
+            out.append(node)
+            node = self.parent[node]
+        return out[::-1]
+
+    def name(self, node: int) -> str:
+        return (self.delim or "").join(self.segment(n) for n in self.path(node))
+
+    def _meta(self, node: int, name: str, segment: str):
+        ref = self.label[node]
+        if ref == LABEL_NONE:
+            text = None
+        elif ref == LABEL_SEGMENT:
+            text = segment
+        elif ref == LABEL_NAME:
+            text = name
+        else:
+            text = self.string(ref)
+        if text is None:
+            return POINT
+        return (NODE_CLASSES[self.cls[node]], text)
+
+    def extract(self, root: Optional[int] = None, *, ancestors: bool = False):
+        """
+        Return (edges, node_meta) for the whole trie, or for the subtree at
+        `root` (optionally with its ancestors), ready for to_dot().
+        """
+        edges = set()
+        nodes = {}
+        if self.delim:
+            nodes["_delim_mode"] = True
+        sep = self.delim or ""
+
+        if root is None:
+            stack = [(n, None) for n in self.children()]
+        else:
+            stack = [(root, self.name(self.parent[root]) if self.parent[root] != NO_PARENT else None)]
+
+            if ancestors:
+                above = self.path(root)[:-1]
+                prefix = None
+                for n in above:
+                    segment = self.segment(n)
+                    name = segment if prefix is None else prefix + sep + segment
+                    nodes[name] = self._meta(n, name, segment)
+                    if prefix is not None:
+                        edges.add((prefix, name))
+                    prefix = name
+                if prefix is not None:
+                    edges.add((prefix, prefix + sep + self.segment(root)))
+
+        while stack:
+            node, up = stack.pop()
+            segment = self.segment(node)
+            name = segment if up is None else up + sep + segment
+            nodes[name] = self._meta(node, name, segment)
+            if up is not None and (root is None or node != root):
+                edges.add((up, name))
+            stack.extend((c, name) for c in self.children(node))
+
+        return edges, nodes
+
+def run_snapshot(args, palette) -> None:
+    """
+    Write DOT (or shards) from a --snapshot file instead of parsed input.
+    """
+    try:
+        frozen = FrozenTrie.load(args.snapshot)
+    except (OSError, ValueError) as exc:
+        args._parser.error(f"--snapshot: {exc}")
+
+    # Trie shape options were fixed when the snapshot was frozen
+    args.delim = frozen.delim
+    args.ignore_case = frozen.ignore_case
+    dbg(args.debug, f"Snapshot {args.snapshot}: {len(frozen)} nodes, {frozen.roots} heads")
+
+    root = None
+    if args.root:
+        root = frozen.find(root_key(args.root, args.delim, args.ignore_case))
+        if root is None:
+            args._parser.error(f"--root prefix '{args.root}' not found in snapshot")
+
+    edges, node_meta = frozen.extract(root, ancestors=args.root_ancestors)
+
+    if args.plan:
+        write_data(plan_report(args, edges, node_meta).encode("utf-8"), args.output)
+    elif args.split_by:
+        write_shards(args, edges, node_meta, palette)
+    else:
+        write_output(graph_dot(args, edges, node_meta, palette), args.output, args.format)
+
+# ---------------------------------------------------------------------------
+# Output cache (--cache)
+# ---------------------------------------------------------------------------
+
+# Options, besides the input and resolved colors, that change the output
+CACHE_OPTIONS = (
+    "filter",
+    "invert_filter",
+    "mark",
+    "head",
+    "delim",
+    "rtl",
+    "ignore_case",
+    "keep_prefix",
+    "keep_fqdn",
+    "normalize",
+    "no_labels",
+    "diff_only",
+    "max_memory",
+    "on_memory_limit",
+    "meta",
+    "meta_key",
+    "meta_style",
+    "root",
+    "root_ancestors",
+    "dir",
+    "format",
+    "large_graph",
+    "short_ids",
+    "dawg",
+)
+
+def input_digest(lines, diff_status, flagged=frozenset()) -> str:
+    """
+    Hash the deduped input lines, together with their --diff tags and
+    --mark-field flags.
+    """
+    h = hashlib.sha256()
+    for line in lines:
+        h.update(line.encode("utf-8", errors="surrogateescape"))
+        h.update(b"\0")
+        h.update((diff_status.get(line) or "").encode("ascii"))
+        if line in flagged:
+            h.update(b"\0mark")
+        h.update(b"\n")
+    return h.hexdigest()
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as fp:
+            for block in iter(lambda: fp.read(1 << 20), b""):
+                h.update(block)
+    except OSError:
+        return ""
+    return h.hexdigest()
+
+class OutputCache:
+    """
+    Content-addressed store of rendered outputs under the share directory.
+
+    Entries are keyed on the input digest, the resolved theme palette, the
+    font and every output-affecting option. Hits refresh the entry's mtime,
+    and the least recently used entries are evicted once the cache grows
+    beyond `max_bytes`.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        # Batch jobs put() from worker threads; one eviction at a time
+        self.lock = threading.Lock()
+
+    def key(self, digest: str, args, palette) -> str:
+        material = {
+            "version": __version__,
+            "input": digest,
+            "palette": palette,
+            "font": FONT_MAP[args.font],
+            "options": {k: getattr(args, k) for k in CACHE_OPTIONS},
+            "meta": file_digest(args.meta) if args.meta else None,
+        }
+        blob = json.dumps(material, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def path(self, key: str, fmt: str) -> Path:
+        return self.directory / f"{key}.{fmt}"
+
+    def get(self, key: str, fmt: str) -> Optional[bytes]:
+        path = self.path(key, fmt)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key: str, fmt: str, data: bytes) -> None:
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            write_atomic(self.path(key, fmt), data)
+            with self.lock:
+                self.evict()
+        except OSError:
+            # A cache that cannot be written is just a cache miss next time
+            pass
+
+    def evict(self) -> None:
+        # Entries can disappear under us (another tries.py sharing the cache)
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.startswith("."):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+            total -= size
+
+def open_cache(args) -> Optional[OutputCache]:
+    """
+    Return the output cache if --cache (or TRIES_CACHE=1) is set and
+    --no-cache is not.
+    """
+    enabled = args.cache or os.environ.get("TRIES_CACHE") == "1"
+    if not enabled or args.no_cache:
+        return None
+    return OutputCache(share_dir() / "cache", args.cache_size * 1024 * 1024)
+
+def emit_cached(args, cache, key, make_dot, cached: Optional[bytes] = None) -> bool:
+    """
+    Write the output for `key`, rendering it with make_dot() on a miss.
+    `cached` is an entry the caller already read. Return False if
+    make_dot() produced nothing (missing --root).
+    """
+    if cache:
+        data = cached if cached is not None else cache.get(key, args.format)
+        if data is not None:
+            dbg(args.debug, f"Cache hit {key[:12]}: writing {args.format} to {args.output or 'stdout'}")
+            write_data(data, args.output)
+            return True
+
+    dot = make_dot()
+    if dot is None:
+        return False
+
+    dbg(args.debug, f"Writing {args.format} to {args.output or 'stdout'}")
+    if not cache:
+        write_output(dot, args.output, args.format)
+        return True
+
+    data = render(dot, args.format)
+    cache.put(key, args.format, data)
+    write_data(data, args.output)
+    return True
+
+# ---------------------------------------------------------------------------
+# Watch mode
+# ---------------------------------------------------------------------------
+
+class Follower:
+    """
+    Tail-style reader for --watch.
+
+    Follows files, and every regular file inside watched directories, and
+    returns the complete lines appended since the previous poll. Files that
+    are truncated or replaced (log rotation) are read again from the start,
+    and files that disappear are closed. Hidden files and the output file
+    itself are skipped.
+    """
+
+    def __init__(self, paths, exclude=()):
+        self.paths = [Path(p) for p in paths]
+        self.exclude = {Path(p).resolve() for p in exclude if p}
+        self.state: Dict[Path, list] = {}
+
+    def targets(self):
+        for path in self.paths:
+            if path.is_dir():
+                for child in sorted(path.iterdir()):
+                    if child.is_file() and not child.name.startswith("."):
+                        yield child
+            else:
+                yield path
+
+    def poll(self) -> List[str]:
+        lines = []
+        present = set()
+
+        for path in self.targets():
+            if path.resolve() in self.exclude:
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            present.add(path)
+
+            state = self.state.get(path)
+            if state and (state[1] != st.st_ino or st.st_size < state[0].tell()):
+                state[0].close()
+                state = None
+
+            if state is None:
+                try:
+                    fp = path.open("r", encoding="utf-8", errors="replace")
+                except OSError:
+                    continue
+                state = self.state[path] = [fp, st.st_ino, ""]
+
+            data = state[0].read()
+            if not data:
+                continue
+
+            # Keep any trailing partial line until its newline arrives
+            parts = (state[2] + data).split("\n")
+            state[2] = parts.pop()
+            lines.extend(parts)
+
+        # Removed files (or ones moved out of a watched directory)
+        for path in self.state.keys() - present:
+            self.state.pop(path)[0].close()
+
+        return lines
+
+def emit_snapshot(args, builder, palette) -> None:
+    """
+    Write the output for the current state of a changing trie.
+    """
+    if args.split_by:
+        if not write_split(args, builder.edges, builder.node_meta, palette):
+            dbg(args.debug, f"--root prefix '{args.root}' not present yet, skipping output")
+        return
+
+    dot = build_dot(args, builder.edges, builder.node_meta, palette)
+    if dot is None:
+        dbg(args.debug, f"--root prefix '{args.root}' not present yet, skipping output")
+        return
+
+    dbg(args.debug, f"Writing {args.format} to {args.output or 'stdout'}")
+    write_output(dot, args.output, args.format)
+    if not args.output:
+        # Successive graphs on stdout, one per line block
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+
+def watch(builder, follower, accept, emit, *, interval, debounce, debug=False):
+    """
+    Insert new lines from `follower` into `builder` until interrupted.
+
+    emit() is called once the trie has changed and the input has been quiet
+    for `debounce` seconds, or has kept changing for ten times that long.
+    """
+    dirty_since = None
+    last_change = None
+
+    while True:
+        time.sleep(interval)
+
+        changed = False
+        added = 0
+        for line in follower.poll():
+            line = line.strip()
+            if line and accept(line):
+                added += 1
+                if builder.insert(line):
+                    changed = True
+
+        now = time.monotonic()
+        if added:
+            dbg(debug, f"Watch: {added} new lines, trie changed: {changed}")
+        if changed:
+            last_change = now
+            if dirty_since is None:
+                dirty_since = now
+
+        if dirty_since is None:
+            continue
+        if now - last_change >= debounce or now - dirty_since >= 10 * debounce:
+            emit()
+            dirty_since = None
+
+# ---------------------------------------------------------------------------
+# Sliding time windows (--window)
+# ---------------------------------------------------------------------------
+
+# Options that need the whole input, or a trie that only ever grows
+WINDOW_CONFLICTS = ("diff", "batch", "freeze", "plan", "assume_sorted", "max_memory", "csv_column", "json_field")
+
+DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def duration(value: str) -> float:
+    """
+    argparse type for --window and --window-step: seconds, or an s/m/h/d suffix.
+    """
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([smhd]?)", value.strip(), re.IGNORECASE)
+    if not m:
+        raise argparse.ArgumentTypeError(f"invalid duration '{value}' (e.g. 90s, 15m, 2h)")
+    return float(m.group(1)) * DURATION_UNITS[m.group(2).lower()]
+
+def parse_time(text: str) -> Optional[float]:
+    """
+    Epoch seconds from a Unix timestamp or an ISO 8601 date and time
+    (UTC when no zone is given), or None.
+    """
+    try:
+        return float(text)
+    except ValueError:
+        pass
+
+    if text.endswith(("Z", "z")):
+        text = text[:-1] + "+00:00"
+    try:
+        stamp = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if stamp.tzinfo is None:
+        stamp = stamp.replace(tzinfo=datetime.timezone.utc)
+    return stamp.timestamp()
+
+def split_time(line: str, field: int) -> Tuple[Optional[float], str]:
+    """
+    Return (timestamp, rest of the line) for --time-field N, the Nth
+    whitespace-separated field.
+    """
+    parts = line.split()
+    if len(parts) < field:
+        return None, ""
+    stamp = parse_time(parts.pop(field - 1))
+    return stamp, " ".join(parts)
+
+class WindowTrie:
+    """
+    The trie of the names seen in the last `window` seconds of a log.
+
+    Lines still go through TrieBuilder.insert(). On top of that, every
+    live key keeps its last-seen time, a heap of (time, key) orders the
+    keys by it (oldest first, even when lines arrive late), and every node
+    counts the live keys at or below it. Heap entries are not removed when
+    a key is seen again; an entry that no longer matches the key's time is
+    skipped when it comes up. As the log time moves on, the oldest keys
+    expire one at a time; nodes whose count
+    drops to zero are removed, so dead branches go with them and memory
+    follows the window rather than the log. Times come from the lines, so
+    a replayed log gives the same tries as a live one.
+
+    Has the builder's edges/node_meta/insert() interface, so watch() and
+    emit_snapshot() work on it unchanged.
+    """
+
+    def __init__(self, builder: TrieBuilder, window: float, time_field: int, accept=None):
+        self.builder = builder
+        self.window = window
+        self.time_field = time_field
+        self.accept = accept
+
+        self.seen: Dict[str, float] = {}
+        self.queue: List[Tuple[float, str]] = []
+        self.refs: Dict[str, int] = {}
+        self.now: Optional[float] = None
+        self.skipped = 0
+        self.expired = 0
+
+    @property
+    def edges(self):
+        return self.builder.edges
+
+    @property
+    def node_meta(self):
+        return self.builder.node_meta
+
+    def insert(self, line: str) -> bool:
+        """
+        Add one timestamped line and expire what fell out of the window.
+        Return True if the trie changed.
+        """
+        stamp, raw = split_time(line, self.time_field)
+        if stamp is None or not raw:
+            self.skipped += 1
+            return False
+        if self.accept and not self.accept(raw):
+            return False
+
+        changed = False
+        if self.now is None or stamp > self.now:
+            self.now = stamp
+            changed = self.expire()
+
+        # Late lines that are already outside the window
+        if stamp <= self.now - self.window:
+            return changed
+
+        key = self.builder.key(raw)
+        if key is None:
+            return changed
+
+        changed |= self.builder.insert(raw)
+        last = self.seen.get(key)
+        if last is None:
+            self._count(key, 1)
+        elif last >= stamp:
+            return changed
+        self.seen[key] = stamp
+        heapq.heappush(self.queue, (stamp, key))
+        return changed
+
+    def expire(self) -> bool:
+        """
+        Drop the keys last seen `window` or more seconds before now.
+        """
+        cutoff = self.now - self.window
+        changed = False
+        queue = self.queue
+        while queue and queue[0][0] <= cutoff:
+            stamp, key = heapq.heappop(queue)
+            if self.seen.get(key) != stamp:
+                continue
+            del self.seen[key]
+            self._count(key, -1)
+            self.expired += 1
+            changed = True
+
+        return changed
+
+    def _count(self, key: str, delta: int) -> None:
+        b = self.builder
+        depth = b._depth(key)
+        for d in range(depth, 0, -1):
+            name = key if d == depth else b._ancestor(key, d)
+            refs = self.refs.get(name, 0) + delta
+            if refs:
+                self.refs[name] = refs
+            else:
+                del self.refs[name]
+                b.remove(name)
+
+        # An expired key that still has live keys below it is a prefix again
+        if delta < 0 and key in self.refs and not b.delim:
+            if depth == 1 and b.head_mode:
+                b.node_meta[key] = ("head", "" if b.no_labels else key)
+            else:
+                b.node_meta[key] = POINT
+
+    def status(self) -> str:
+        nodes = len(self.node_meta) - ("_delim_mode" in self.node_meta)
+        return f"{len(self.seen)} live keys, {nodes} nodes, {self.expired} expired, {self.skipped} lines without a timestamp"
+
+def run_window(args, palette, lines) -> None:
+    """
+    Stream timestamped lines through a WindowTrie (--window), writing a
+    snapshot every --window-step of log time, at the end of the input,
+    and on change while following --watch paths.
+    """
+    window = WindowTrie(
+        new_builder(args),
+        args.window,
+        args.time_field,
+        accept=line_filter(args.filter, args.invert_filter),
+    )
+
+    # Named files are read once, as in watch mode, before the watched paths
+    follower = None
+    if args.files or not (lines or args.watch):
+        lines = itertools.chain(lines, read_lines(args.files))
+    if args.watch:
+        follower = Follower(args.watch, exclude=[args.output])
+        lines = itertools.chain(lines, follower.poll())
+
+    def emit():
+        dbg(args.debug, f"Window at {window.now}: {window.status()}")
+        emit_snapshot(args, window, palette)
+
+    due = None
+    changed = False
+    for line in lines:
+        changed |= window.insert(line)
+        if not args.window_step or window.now is None:
+            continue
+        if due is None:
+            due = window.now + args.window_step
+        elif window.now >= due:
+            if changed:
+                emit()
+                changed = False
+            due = window.now + args.window_step
+
+    emit()
+    if not follower:
+        return
+
+    try:
+        watch(
+            window,
+            follower,
+            lambda line: True,
+            emit,
+            interval=args.interval,
+            debounce=args.debounce,
+            debug=args.debug,
+        )
+    except KeyboardInterrupt:
+        dbg(args.debug, "Watch interrupted, exiting")
+
+# ---------------------------------------------------------------------------
+# Batch mode
+# ---------------------------------------------------------------------------
+
+# Options that decide which lines are inserted or how the trie is shaped.
+# Batch jobs that agree on all of these share one build; everything else
+# (theme, colors, font, direction, --root, format) only changes presentation.
+STRUCTURE_OPTIONS = (
+    "filter",
+    "invert_filter",
+    "mark",
+    "head",
+    "delim",
+    "rtl",
+    "ignore_case",
+    "keep_prefix",
+    "keep_fqdn",
+    "normalize",
+    "no_labels",
+    "diff_only",
+    "max_memory",
+    "on_memory_limit",
+    "meta",
+    "meta_key",
+    "meta_style",
+)
+
+# Options that cannot vary between jobs: the input is read once per batch
+FIXED_OPTIONS = (
+    "files",
+    "csv_column",
+    "json_field",
+    "csv_delimiter",
+    "csv_quote",
+    "mark_field",
+    "diff",
+    "watch",
+    "interval",
+    "debounce",
+    "time_field",
+    "window",
+    "window_step",
+    "batch",
+    "jobs",
+    "freeze",
+    "snapshot",
+    "plan",
+    "assume_sorted",
+    "sample_hosts",
+    "sample_ips",
+    "sample_paths",
+    "sample_urls",
+    "sample_emails",
+    "sample_nato",
+    "list_themes",
+    "dump_themes",
+    "save_theme",
+    "version",
+    "debug",
+    "progress",
+)
+
+def load_batch_spec(args) -> List[Dict]:
+    """
+    Read the JSON or TOML --batch spec and return its jobs with defaults
+    applied.
+
+    The spec is either a list of jobs or a table with "jobs" and optional
+    "defaults". Job keys are long option names ("theme", "dir", "mark",
+    "color-normal", ...) plus "output" and an optional "format".
+    """
+    path, parser = args.batch, args._parser
+
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            parser.error("TOML batch specs need Python 3.11+ (tomllib)")
+        decode, errors = tomllib.loads, tomllib.TOMLDecodeError
+    else:
+        decode, errors = json.loads, json.JSONDecodeError
 
-    if edge_color:
-        out.append(f'  edge [color="{edge_color}"];')
+    try:
+        spec = decode(Path(path).read_text(encoding="utf-8"))
+    except (OSError, UnicodeDecodeError, errors) as exc:
+        parser.error(f"--batch: {path}: {exc}")
 
-    delim_mode = nodes.get("_delim_mode", False)
+    if isinstance(spec, list):
+        defaults, jobs = {}, spec
+    elif isinstance(spec, dict):
+        defaults, jobs = spec.get("defaults", {}), spec.get("jobs", [])
+    else:
+        defaults, jobs = None, None
+    if not isinstance(defaults, dict) or not isinstance(jobs, list) or not all(isinstance(j, dict) for j in jobs):
+        parser.error(f"--batch: {path}: expected a list of jobs, or a table with 'jobs' and 'defaults'")
 
-    # Node declarations
-    for name in sorted(nodes.keys()):
-        if name == "_delim_mode":
+    return [{**defaults, **job} for job in jobs]
+
+def job_args(args, job: Dict, index: int):
+    """
+    Return a copy of the command-line options with one batch job applied.
+    """
+    parser = args._parser
+    merged = argparse.Namespace(**vars(args))
+
+    output = job.get("output")
+    if not output:
+        parser.error(f"--batch job {index}: 'output' is required")
+
+    actions = {action.dest: action for action in parser._actions}
+    dests = []
+    argv = []
+    lists: Dict[str, List[str]] = {}
+    for key, value in job.items():
+        dest = key.replace("-", "_")
+        if dest in ("output", "format"):
+            continue
+        if dest not in vars(args) or dest.startswith("_"):
+            parser.error(f"--batch job {index}: unknown option '{key}'")
+        if dest in FIXED_OPTIONS:
+            parser.error(f"--batch job {index}: '{key}' cannot vary between jobs")
+
+        # On/off switches take true/false, null resets an option to its
+        # default, and lists only go to options that take several values
+        action = actions[dest]
+        switch = action.nargs == 0 and isinstance(action.const, bool)
+        if value is None:
+            setattr(merged, dest, parser.get_default(dest))
+            continue
+        if switch != isinstance(value, bool):
+            wanted = "true or false" if switch else "a value, not true/false"
+            parser.error(f"--batch job {index}: '{key}' takes {wanted}")
+        if switch:
+            setattr(merged, dest, value)
             continue
+        if isinstance(value, list) and action.nargs not in ("*", "+") and not isinstance(action.default, list):
+            parser.error(f"--batch job {index}: '{key}' takes a single value, not a list")
+        if isinstance(value, dict):
+            parser.error(f"--batch job {index}: '{key}' takes a value, not a table")
+
+        dests.append(dest)
+        # "--flag=value" keeps values that start with "-" from reading as options
+        flag = "--" + dest.replace("_", "-")
+        if isinstance(value, list):
+            lists[dest] = [f"{flag}={item}" for item in value]
+        else:
+            argv.append(f"{flag}={value}")
+
+    # Let argparse validate choices and types for the job values. List
+    # items are parsed one at a time, as "--flag=a b" would be one value.
+    parsed = parser.parse_args(argv)
+    for dest in dests:
+        if dest in lists:
+            value = [v for item in lists[dest] for v in getattr(parser.parse_args([item]), dest)]
+        else:
+            value = getattr(parsed, dest)
+        setattr(merged, dest, value)
 
-        attrs = dict(nodes[name])
-        safe = dot_escape(name)
+    # A job's --normalize implies its own delimiter unless -D was given
+    if "normalize" in dests and "delim" not in dests and args._explicit_delim is None:
+        merged.delim = NORMALIZE_DELIMS[merged.normalize]
 
-        # Normal attributes
-        if attrs.get("shape") == "point" and point_color:
-            attrs.setdefault("color", point_color)
+    ext = Path(output).suffix.lstrip(".").lower()
+    merged.output = output
+    merged.format = job.get("format") or (ext if ext in OUTPUT_FORMATS else args.format)
+    if merged.format not in OUTPUT_FORMATS:
+        parser.error(f"--batch job {index}: unknown format '{merged.format}'")
+    if merged.dawg and merged.format == "html":
+        parser.error(f"--batch job {index}: the HTML viewer browses a tree; drop --dawg")
 
-        parts = []
-        for k, v in attrs.items():
-            if k == "label":
-                v = dot_escape(v)
-            parts.append(f'{k}="{v}"')
+    return merged
 
-        out.append(f'  "{safe}" [{", ".join(parts)}];')
+def job_palette(job):
+    return dict(zip(PALETTE_KEYS, resolve_theme_values(job)))
 
-    # ---------------------------------------------------------
-    # CHARACTER MODE ONLY: alphabetical single-character heads
-    # ---------------------------------------------------------
-    if not delim_mode:
-        heads = sorted([n for n in nodes.keys() if len(n) == 1])
-        if heads:
-            out.append(
-                "  { rank = same; " +
-                "; ".join(f'"{dot_escape(h)}"' for h in heads) +
-                " }"
-            )
-            for a, b in zip(heads, heads[1:]):
-                out.append(f'  "{dot_escape(a)}" -- "{dot_escape(b)}" [style=invis];')
+def run_job(job, build, cache=None, key=None, cached=None) -> None:
+    palette = job_palette(job)
 
-    # Real edges
-    for p, c in sorted(edges):
-        out.append(f'  "{dot_escape(p)}" -- "{dot_escape(c)}";')
+    if job.split_by:
+        if not write_split(job, *build(), palette):
+            sys.exit(f"tries.py: error: --root prefix '{job.root}' not found in trie ({job.output})")
+        return
 
-    out.append("}")
-    return "\n".join(out)
+    def make_dot():
+        return build_dot(job, *build(), palette)
+
+    if not emit_cached(job, cache, key, make_dot, cached):
+        sys.exit(f"tries.py: error: --root prefix '{job.root}' not found in trie ({job.output})")
+
+def run_batch(args, lines, diff_status, cache=None) -> None:
+    """
+    Run every job in the --batch spec against one parsed input.
+
+    Jobs are grouped by STRUCTURE_OPTIONS so each distinct trie is built
+    once; rendering and writing run in parallel on a thread pool, which
+    overlaps the Graphviz subprocesses.
+    """
+    jobs = [job_args(args, job, i) for i, job in enumerate(load_batch_spec(args), 1)]
+
+    groups: Dict[tuple, list] = {}
+    for job in jobs:
+        key = tuple(
+            tuple(v) if isinstance(v, list) else v
+            for v in (getattr(job, k) for k in STRUCTURE_OPTIONS)
+        )
+        groups.setdefault(key, []).append(job)
+
+    dbg(args.debug, f"Batch: {len(jobs)} jobs, {len(groups)} distinct tries")
+
+    flagged = args._records.flagged if args._records else frozenset()
+    digest = input_digest(lines, diff_status, flagged) if cache else None
+
+    def group_build(first):
+        # Build each group's trie at most once, and only if some job needs it
+        built = []
+
+        def build():
+            if not built:
+                matched = filter_lines(lines, first.filter, first.invert_filter)
+                builder = new_builder(first)
+                insert_lines(
+                    builder,
+                    matched,
+                    diff_status,
+                    first.diff_only and bool(first.diff),
+                    Progress(first.progress),
+                    first.engine,
+                )
+                built.append((builder.edges, builder.node_meta))
+            return built[0]
+
+        return build
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = []
+        for members in groups.values():
+            build = group_build(members[0])
+            for job in members:
+                key = cache.key(digest, job, job_palette(job)) if cache else None
+                # A hit is handed over as read: another job's put() may evict
+                # it before the worker runs, and workers must not build
+                cached = cache.get(key, job.format) if cache else None
+                if cached is None:
+                    # Build before handing off so worker threads share one trie
+                    build()
+                futures.append(pool.submit(run_job, job, build, cache, key, cached))
+
+        for future in futures:
+            future.result()
 
 # ---------------------------------------------------------------------------
 # Sample data
@@ -610,6 +4155,16 @@ def parse_args(argv=None):
         help="Keep full DNS name (default is to strip after first '.').",
     )
 
+    parser.add_argument(
+        "--normalize",
+        choices=NORMALIZERS,
+        help=(
+            "Parse each line as a host, URL, email or IP address and build the trie "
+            "from its canonical form (implies -D / for urls, -D @ for emails and "
+            "-D . for ips unless -D is given)."
+        ),
+    )
+
     parser.add_argument(
         "-f", "--filter",
         default=".*",
@@ -622,6 +4177,49 @@ def parse_args(argv=None):
         help="Invert the regex filter: keep lines that do NOT match.",
     )
 
+    parser.add_argument(
+        "--csv-column",
+        metavar="COLUMN",
+        help=(
+            "Read input as CSV with a header row and use this column (name or "
+            "1-based position) as the key, instead of whole lines."
+        ),
+    )
+
+    parser.add_argument(
+        "--json-field",
+        metavar="PATH",
+        help=(
+            "Read input as JSON lines and use this field as the key; nested "
+            "fields and list items are dotted (e.g. 'host.name', 'tags.0')."
+        ),
+    )
+
+    parser.add_argument(
+        "--csv-delimiter",
+        type=csv_char,
+        default=",",
+        metavar="CHAR",
+        help="Field delimiter for --csv-column ('tab' for tabs, default ',').",
+    )
+
+    parser.add_argument(
+        "--csv-quote",
+        type=csv_char,
+        default='"',
+        metavar="CHAR",
+        help="Quote character for --csv-column (default '\"').",
+    )
+
+    parser.add_argument(
+        "--mark-field",
+        metavar="FIELD",
+        help=(
+            "With --csv-column or --json-field, mark the terminals of records whose "
+            "FIELD is set (anything but empty, 0, false, no, off, none or null)."
+        ),
+    )
+
     parser.add_argument(
         "-M", "--mark",
         nargs="*",
@@ -669,11 +4267,260 @@ def parse_args(argv=None):
         help="Reverse token order in --delim mode (e.g. email domains: com -> example -> user).",
     )
 
+    parser.add_argument(
+        "--root",
+        metavar="PREFIX",
+        help=(
+            "Only emit the subtree below this prefix node (e.g. 'acmefw', or '10.20' "
+            "with -D .)."
+        ),
+    )
+
+    parser.add_argument(
+        "--root-ancestors",
+        action="store_true",
+        help="With --root, also keep the path from the head node down to the prefix.",
+    )
+
     parser.add_argument(
         "-o", "--output",
         help="Write DOT output to this file instead of stdout.",
     )
 
+    parser.add_argument(
+        "--diff",
+        nargs=2,
+        metavar=("OLD", "NEW"),
+        type=argparse.FileType("r"),
+        help="Compare two inputs in one trie, colouring added and removed terminals.",
+    )
+
+    parser.add_argument(
+        "--diff-only",
+        action="store_true",
+        help="With --diff, drop unchanged lines so only changed branches are drawn.",
+    )
+
+    parser.add_argument(
+        "--meta",
+        metavar="FILE",
+        help=(
+            "CSV file (with a header row) of per-terminal metadata, e.g. a CMDB export. "
+            "Rows are joined to input lines on --meta-key, normalised like the input."
+        ),
+    )
+
+    parser.add_argument(
+        "--meta-key",
+        metavar="COLUMN",
+        help="Column of --meta holding the host name, path or address (default: the first column).",
+    )
+
+    parser.add_argument(
+        "--meta-style",
+        type=meta_style,
+        action="append",
+        default=[],
+        metavar="COLUMN=ATTR",
+        help=(
+            "Set the DOT attribute ATTR of matching terminals from COLUMN, e.g. "
+            "color=fillcolor, owner=tooltip, team=xlabel. Repeatable."
+        ),
+    )
+
+    parser.add_argument(
+        "--max-memory",
+        type=memory_size,
+        metavar="SIZE",
+        help=(
+            "Budget for the trie's node store, in MB or with a K/M/G suffix. "
+            "See --on-memory-limit for what happens when it is reached."
+        ),
+    )
+
+    parser.add_argument(
+        "--on-memory-limit",
+        choices=MEMORY_STRATEGIES,
+        default="abort",
+        help=(
+            "When --max-memory is reached: abort with partial statistics (default), "
+            "prune the trie to a shallower depth, or prune and replace each cut-off "
+            "branch with a summary node counting its keys."
+        ),
+    )
+
+    parser.add_argument(
+        "--dawg",
+        action="store_true",
+        help=(
+            "Merge identical subtrees into a minimised word graph (DAWG), so shared "
+            "suffixes are drawn once; nodes then show their own character or token."
+        ),
+    )
+
+    parser.add_argument(
+        "--short-ids",
+        action="store_true",
+        help=(
+            "Use compact node IDs (n0, n1, ...) in the DOT output and keep the "
+            "prefix text only in labels."
+        ),
+    )
+
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help=(
+            "Build the trie but print a report instead of DOT: counts, unary-chain "
+            "ratio, depth and fan-out histograms, estimated DOT size and layout time."
+        ),
+    )
+
+    parser.add_argument(
+        "--large-graph",
+        action="store_true",
+        help=(
+            "Tune Graphviz layout attributes to the trie's size and shape, and print "
+            "a rough layout-time estimate to stderr."
+        ),
+    )
+
+    parser.add_argument(
+        "--split-by",
+        type=split_depth,
+        metavar="head|depth=N",
+        help=(
+            "Write one file per branch (head characters, or first tokens with -D) "
+            "into the -o directory, plus an index graph linking to them. "
+            "depth=N cuts N levels down instead."
+        ),
+    )
+
+    parser.add_argument(
+        "--freeze",
+        metavar="FILE",
+        help=(
+            "Write the built trie to FILE as a read-only array snapshot instead of "
+            "DOT output."
+        ),
+    )
+
+    parser.add_argument(
+        "--snapshot",
+        metavar="FILE",
+        help=(
+            "Load the trie from a --freeze snapshot instead of reading input. "
+            "Theme, output and --root options still apply."
+        ),
+    )
+
+    parser.add_argument(
+        "--batch",
+        metavar="SPEC",
+        help=(
+            "Read input once and write every job in this JSON or TOML spec "
+            "(see README). Jobs that only differ in presentation share one trie."
+        ),
+    )
+
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        metavar="N",
+        help="Parallel render workers for --batch and --split-by (default: CPU count).",
+    )
+
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help=(
+            "Reuse outputs cached under the tries share directory when the input, "
+            "theme and options are unchanged (also enabled by TRIES_CACHE=1)."
+        ),
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the output cache even if --cache or TRIES_CACHE=1 is set.",
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=256,
+        metavar="MB",
+        help="Evict least recently used cache entries beyond this size (default: 256).",
+    )
+
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="dot",
+        help=(
+            "Output format. html is a self-contained page that expands the trie on "
+            "click; png, svg and pdf are rendered with Graphviz."
+        ),
+    )
+
+    parser.add_argument(
+        "--watch",
+        nargs="+",
+        metavar="PATH",
+        help=(
+            "Follow these files (tail-style) or directories and rewrite -o whenever "
+            "the trie changes."
+        ),
+    )
+
+    parser.add_argument(
+        "--time-field",
+        type=int,
+        metavar="N",
+        help=(
+            "Lines are timestamped: field N (1-based, whitespace-separated) is a Unix "
+            "time or ISO 8601 date-time and the rest of the line is the name. Use with --window."
+        ),
+    )
+
+    parser.add_argument(
+        "--window",
+        type=duration,
+        metavar="DURATION",
+        help=(
+            "Only keep names seen in the last DURATION of log time (e.g. 15m, 2h); "
+            "older names expire and empty branches are pruned. Needs --time-field."
+        ),
+    )
+
+    parser.add_argument(
+        "--window-step",
+        type=duration,
+        default=60.0,
+        metavar="DURATION",
+        help=(
+            "With --window, write a snapshot each time the log time advances this much "
+            "(default: 1m; 0 writes only at the end of the input)."
+        ),
+    )
+
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        metavar="SECONDS",
+        help="Polling interval for --watch (default: 1.0).",
+    )
+
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.5,
+        metavar="SECONDS",
+        help="Wait until --watch input has been quiet this long before re-emitting (default: 0.5).",
+    )
+
     parser.add_argument(
         "-T", "--theme",
         choices=sorted(THEMES.keys()),
@@ -719,6 +4566,18 @@ def parse_args(argv=None):
         default="gray60",
         help="Override theme point-node color.",
     )
+    parser.add_argument(
+        "-ca", "--color-added",
+        dest="color_added",
+        default="palegreen",
+        help="Override theme color for terminals added in --diff mode.",
+    )
+    parser.add_argument(
+        "-cr", "--color-removed",
+        dest="color_removed",
+        default="lightpink",
+        help="Override theme color for terminals removed in --diff mode.",
+    )
 
     # Font-color overrides
     parser.add_argument(
@@ -796,6 +4655,36 @@ def parse_args(argv=None):
         help="Print version and exit.",
     )
 
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="python",
+        help=(
+            "Trie construction engine. 'numpy' builds character-mode tries in bulk "
+            "from sorted keys using NumPy prefix comparisons; 'auto' uses it for large "
+            "inputs when NumPy is installed. Output is identical either way."
+        ),
+    )
+
+    parser.add_argument(
+        "--assume-sorted",
+        action="store_true",
+        help=(
+            "Input is already sorted: stream it straight to DOT without deduping or "
+            "building the trie in memory. Stops with an error on out-of-order input."
+        ),
+    )
+
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help=(
+            "Print a status line to stderr about once a second while reading and "
+            "building: lines, rate, unique keys, nodes, estimated memory, elapsed "
+            "time, and an ETA when the input size is known."
+        ),
+    )
+
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -804,6 +4693,27 @@ def parse_args(argv=None):
 
     args = parser.parse_args(argv)
     args._parser = parser
+
+    # -D as given; --normalize fills in its own delimiter otherwise
+    args._explicit_delim = args.delim
+    if args.normalize and args.delim is None:
+        args.delim = NORMALIZE_DELIMS[args.normalize]
+
+    if (args.meta_key or args.meta_style) and not args.meta:
+        parser.error("--meta-key and --meta-style need --meta FILE")
+    if bool(args.window) != bool(args.time_field):
+        parser.error("--window and --time-field go together")
+    if args.time_field is not None and args.time_field < 1:
+        parser.error("--time-field counts fields from 1")
+    if args.jobs < 1:
+        parser.error("-j/--jobs needs at least one worker")
+    if args.dawg and args.format == "html":
+        parser.error("the HTML viewer browses a tree; drop --dawg with --format html")
+    if args.csv_column and args.json_field:
+        parser.error("--csv-column and --json-field cannot be combined")
+    if args.mark_field and not (args.csv_column or args.json_field):
+        parser.error("--mark-field needs --csv-column or --json-field")
+    args._records = record_reader(args)
     return args
 
 # ---------------------------------------------------------------------------
@@ -834,7 +4744,8 @@ def main(argv=None):
     dbg(args.debug, f"Args: {args}")
 
     # Resolve theme colors and text
-    cn, cm, ch, ce, cp, text_normal, text_mark, text_head = resolve_theme_values(args)
+    cn, cm, ch, ce, cp, text_normal, text_mark, text_head, ca, cr = resolve_theme_values(args)
+    palette = dict(zip(PALETTE_KEYS, (cn, cm, ch, ce, cp, text_normal, text_mark, text_head, ca, cr)))
 
     # ----------------------------------------------------------------------
     # Save theme (uses resolved values)
@@ -848,22 +4759,15 @@ def main(argv=None):
             "head": ch,
             "edge": ce,
             "point": cp,
+            "added": ca,
+            "removed": cr,
             "text_normal": text_normal,
             "text_mark": text_mark,
             "text_head": text_head,
         }
 
         # Determine correct install target (matches loader logic)
-        prefix_env = os.environ.get("PREFIX", None)
-        if prefix_env and prefix_env != str(Path.home()):
-            target_dir = Path(prefix_env) / "share" / "tries"
-        else:
-            xdg = os.environ.get("XDG_DATA_HOME")
-            if xdg:
-                target_dir = Path(xdg) / "tries"
-            else:
-                target_dir = Path.home() / ".local" / "share" / "tries"
-
+        target_dir = share_dir()
         target_dir.mkdir(parents=True, exist_ok=True)
 
         custom_path = target_dir / "themes_custom.py"
@@ -911,90 +4815,198 @@ def main(argv=None):
         if getattr(args, flag):
             combined.extend(SAMPLES.get(name, []))
 
-    # Add file input
-    if args.files:
-        combined.extend(read_lines(args.files))
+    # A snapshot replaces all parsed input
+    if args.snapshot:
+        if combined or args.files or args.diff or args.watch or args.batch or args.freeze:
+            args._parser.error("--snapshot cannot be combined with other input, --batch or --freeze")
+        if args.split_by and not args.output:
+            args._parser.error("--split-by requires -o/--output (a directory)")
+        run_snapshot(args, palette)
+        return
+
+    # Presorted input is streamed straight to DOT without building a trie
+    if args.assume_sorted:
+        conflicts = [f"--{o.replace('_', '-')}" for o in SORTED_CONFLICTS if getattr(args, o)]
+        if conflicts:
+            args._parser.error(f"--assume-sorted cannot be combined with {', '.join(conflicts)}")
+        if args.format != "dot":
+            args._parser.error("--assume-sorted writes DOT; render it with Graphviz afterwards")
+
+        batches = [combined]
+        size = None
+        if args.files or not combined:
+            batches = itertools.chain(batches, read_batches(args.files, records=args._records))
+            size = input_size(args.files) if args.progress else None
+        run_sorted(args, palette, batches, size)
+        return
 
-    # stdin fallback
-    raw_lines = combined if combined else read_lines(args.files)
+    # Timestamped lines stream through a sliding window in input order
+    if args.window:
+        conflicts = [f"--{o.replace('_', '-')}" for o in WINDOW_CONFLICTS if getattr(args, o)]
+        if conflicts:
+            args._parser.error(f"--window cannot be combined with {', '.join(conflicts)}")
+        if args.watch and not args.output:
+            args._parser.error("--watch requires -o/--output")
+        if args.split_by and not args.output:
+            args._parser.error("--split-by requires -o/--output (a directory)")
+        run_window(args, palette, combined)
+        return
 
-    # ----------------------------------------------------------------------
+    # Diff mode: both inputs go into one trie, each line tagged by status
+    diff_status: Dict[str, Optional[str]] = {}
+    if args.diff:
+        if args.files or args.watch:
+            args._parser.error("--diff cannot be combined with input files or --watch")
+
+        old = {l.strip() for l in read_lines([args.diff[0]], args._records) if l.strip()}
+        new = {l.strip() for l in read_lines([args.diff[1]], args._records) if l.strip()}
+
+        for line in old - new:
+            diff_status[line] = "removed"
+        for line in new - old:
+            diff_status[line] = "added"
+        combined.extend(old | new)
+
+        dbg(args.debug, f"Diff: {len(new - old)} added, {len(old - new)} removed, {len(old & new)} unchanged")
+
+    # Add the current contents of watched files
+    follower = None
+    if args.watch:
+        if not args.output:
+            args._parser.error("--watch requires -o/--output")
+        if args.batch or args.freeze or args.plan:
+            args._parser.error("--watch cannot be combined with --batch, --freeze or --plan")
+        if args._records:
+            args._parser.error("--watch follows plain lines; it cannot be combined with --csv-column or --json-field")
+        follower = Follower(args.watch, exclude=[args.output])
+        combined.extend(follower.poll())
 
-    # Strip and dedupe
-    raw_lines = [line.strip() for line in raw_lines if line.strip()]
-    lines = sorted(set(raw_lines))
+    # ----------------------------------------------------------------------
 
-    dbg(args.debug, f"Read {len(raw_lines)} raw lines, {len(lines)} unique after dedupe.")
-    dbg(args.debug, f"Lines: {lines}")
+    # Files, or stdin when there is no other input, are read on a background
+    # thread while this one strips and dedupes
+    batches = [combined]
+    size = None
+    if args.files or not (combined or follower or args.diff):
+        batches = itertools.chain(batches, read_batches(args.files, records=args._records))
+        size = input_size(args.files) if args.progress else None
+
+    raw_count, unique = unique_lines(batches, Progress(args.progress), size)
+    lines = sorted(unique)
+
+    dbg(args.debug, f"Read {raw_count} raw lines, {len(lines)} unique after dedupe.")
+    if args.debug:
+        dbg(args.debug, f"Lines: {lines}")
+
+    # Watch mode keeps changing its input, so it never uses the cache
+    cache = None if follower else open_cache(args)
+
+    if args.batch:
+        if args.freeze or args.plan:
+            args._parser.error("--batch cannot be combined with --freeze or --plan")
+        if args.output:
+            args._parser.error("--batch writes each job's own output; do not use -o")
+        run_batch(args, lines, diff_status, cache)
+        return
 
     # Filtering
-    pat = re.compile(args.filter)
-
-    if args.invert_filter:
-        matched = [l for l in lines if not pat.search(l)]
-    else:
-        matched = [l for l in lines if pat.search(l)]
+    accept = line_filter(args.filter, args.invert_filter)
+    matched = list(filter(accept, lines))
 
-    dbg(args.debug, f"Filter regex: {args.filter}")
+    dbg(args.debug, f"Filter regex: {args.filter} (prefix: {anchored_prefix(args.filter)!r})")
     dbg(args.debug, f"{len(matched)} lines matched filter.")
-    dbg(args.debug, f"Matched: {matched}")
-
-    # Marking patterns
-    # Fix: If user passes -M '' (empty string), treat as "match nothing"
-    if args.mark == [""]:
-        effective_mark_patterns = []
-    else:
-        effective_mark_patterns = args.mark
-    mark_is_default = (effective_mark_patterns == DEFAULT_MARK_PATTERNS)
+    if args.debug:
+        dbg(args.debug, f"Matched: {matched}")
 
     dbg(args.debug, "Resolved colors & text:")
     dbg(args.debug, f"  normal={cn}, mark={cm}, head={ch}, edge={ce}, point={cp}")
+    dbg(args.debug, f"  added={ca}, removed={cr}")
     dbg(args.debug, f"  text_normal={text_normal}, text_mark={text_mark}, text_head={text_head}")
 
-    # Head-mode is only meaningful in character-mode
-    if args.delim:
-        args.head = False
-
-    # Build trie
-    edges, node_meta = trie(
-        matched,
-        mark_patterns=effective_mark_patterns,
-        mark_is_default=mark_is_default,
-        head_mode=args.head,
-        color_normal=cn,
-        color_mark=cm,
-        color_head=ch,
-        keep_prefix=args.keep_prefix,
-        keep_fqdn=args.keep_fqdn,
-        ignore_case=args.ignore_case,
-        no_labels=args.no_labels,
-        text_normal=text_normal,
-        text_mark=text_mark,
-        text_head=text_head,
-        delim=args.delim,
-        rtl=args.rtl,
-    )
-
-    dbg(args.debug, f"Final edge count: {len(edges)}")
-    dbg(args.debug, f"Final node count: {len(node_meta)}")
-
-    fontname = FONT_MAP[args.font]
-
-    dot = to_dot(
-        edges,
-        node_meta,
-        rankdir=args.dir,
-        edge_color=ce,
-        point_color=cp,
-        fontname=fontname,
-    )
+    # Build trie. Lines outside --root can be skipped while inserting,
+    # unless the whole trie is kept (--freeze)
+    def build():
+        builder = new_builder(args)
+        if args.root and not args.freeze:
+            builder.restrict(args.root, ancestors=args.root_ancestors)
+        insert_lines(
+            builder,
+            matched,
+            diff_status,
+            args.diff_only and bool(args.diff),
+            Progress(args.progress),
+            args.engine,
+        )
+        return builder
+
+    if args.split_by:
+        if not args.output:
+            args._parser.error("--split-by requires -o/--output (a directory)")
+        cache = None
+
+    if not follower:
+        if args.plan:
+            builder = build()
+            if not write_plan(args, builder, matched):
+                args._parser.error(f"--root prefix '{args.root}' not found in trie")
+            return
+
+        if args.freeze:
+            if args.meta:
+                args._parser.error("--meta attributes are not stored in snapshots; drop --meta with --freeze")
+            if args.dawg:
+                args._parser.error("snapshots store the trie; use --dawg when writing from --snapshot")
+            builder = build()
+            frozen = FrozenTrie.freeze(
+                builder.edges,
+                builder.node_meta,
+                delim=args.delim,
+                ignore_case=args.ignore_case,
+            )
+            frozen.save(args.freeze)
+            dbg(args.debug, f"Froze {len(frozen)} nodes into {args.freeze}")
+            return
+
+        if args.split_by:
+            builder = build()
+            if not write_split(args, builder.edges, builder.node_meta, palette):
+                args._parser.error(f"--root prefix '{args.root}' not found in trie")
+            return
+
+        def make_dot():
+            builder = build()
+            return build_dot(args, builder.edges, builder.node_meta, palette)
+
+        flagged = args._records.flagged if args._records else frozenset()
+        key = cache.key(input_digest(lines, diff_status, flagged), args, palette) if cache else None
+        if not emit_cached(args, cache, key, make_dot):
+            args._parser.error(f"--root prefix '{args.root}' not found in trie")
+        return
 
-    if args.output:
-        dbg(args.debug, f"Writing DOT to {args.output}")
-        Path(args.output).write_text(dot)
-    else:
-        dbg(args.debug, "Writing DOT to stdout")
-        sys.stdout.write(dot)
+    # ----------------------------------------------------------------------
+    # Watch mode: keep the builder and re-emit on change
+    # ----------------------------------------------------------------------
+    builder = build()
+
+    def emit():
+        emit_snapshot(args, builder, palette)
+
+    emit()
+
+    try:
+        watch(
+            builder,
+            follower,
+            accept,
+            emit,
+            interval=args.interval,
+            debounce=args.debounce,
+            debug=args.debug,
+        )
+    except KeyboardInterrupt:
+        dbg(args.debug, "Watch interrupted, exiting")
+    except MemoryBudgetError as exc:
+        sys.exit(memory_error(exc))
 
 if __name__ == "__main__":
     main()